@@ -1,10 +1,12 @@
-import pygame
-import os
 from settings import *
+from asset_cache import load_sprite_sheets
 
 class Animation:
     def __init__(self, default_state='idle'):
+        # Frame lists are shared through the asset cache, so an Animation
+        # only tracks its state and frame index
         self.sprites = {}
+        self.flipped_sprites = {}
         self.current_frame = 0
         self.animation_time = 0
         self.current_state = default_state
@@ -20,20 +22,11 @@ class Animation:
                 frame1.png
                 frame2.png
                 ...
+        Each directory is only decoded once per process.
         """
-        for state in os.listdir(path):
-            state_path = os.path.join(path, state)
-            if os.path.isdir(state_path):
-                self.sprites[state] = []
-                for frame in sorted(os.listdir(state_path)):
-                    if frame.endswith('.png'):
-                        image_path = os.path.join(state_path, frame)
-                        image = pygame.image.load(image_path).convert_alpha()
-                        if scale != 1:
-                            new_width = image.get_width() * scale
-                            new_height = image.get_height() * scale
-                            image = pygame.transform.scale(image, (new_width, new_height))
-                        self.sprites[state].append(image)
+        frames, flipped_frames = load_sprite_sheets(path, scale)
+        self.sprites = {**self.sprites, **frames}
+        self.flipped_sprites = {**self.flipped_sprites, **flipped_frames}
 
     def set_state(self, new_state):
         """
@@ -59,10 +52,9 @@ class Animation:
         if self.current_state not in self.sprites:
             return None
             
-        current_frame = self.sprites[self.current_state][self.current_frame]
         if flip_x:
-            return pygame.transform.flip(current_frame, True, False)
-        return current_frame
+            return self.flipped_sprites[self.current_state][self.current_frame]
+        return self.sprites[self.current_state][self.current_frame]
 
     def update(self, dt):
         """
@@ -0,0 +1,139 @@
+import pygame
+import os
+from settings import *
+from texture_atlas import TextureAtlas, source_images
+
+# Process-wide cache of decoded and converted images, keyed by path.
+# Surfaces handed out from here are shared and must not be drawn on.
+_image_cache = {}
+_frame_cache = {}
+_sheet_cache = {}
+_opaque_cache = {}  # path -> whether the image has no transparent pixels
+_atlas = None
+
+def load_atlas(manifest_path=ATLAS_MANIFEST_PATH):
+    """
+    Serve images from a texture atlas: the one saved at manifest_path if
+    it was packed from the current ATLAS_SOURCES, otherwise one packed now
+    and saved there for the next run. Needs the display to be set up.
+    """
+    global _atlas
+    paths = source_images()
+    atlas = None
+    if os.path.exists(manifest_path):
+        try:
+            atlas = TextureAtlas.load(manifest_path)
+        except (OSError, ValueError, KeyError, pygame.error) as error:
+            print(f"Warning: could not load texture atlas {manifest_path}: {error}")
+        if atlas is not None and not atlas.is_current(paths):
+            atlas = None  # Source images changed since it was built
+    if atlas is None:
+        atlas = TextureAtlas()
+        atlas.pack_files(paths)
+        try:
+            atlas.save(manifest_path)
+        except (OSError, pygame.error) as error:
+            print(f"Warning: could not save texture atlas {manifest_path}: {error}")
+    atlas.convert()
+    _atlas = atlas
+    _image_cache.clear()
+    _frame_cache.clear()
+    _sheet_cache.clear()
+    _opaque_cache.clear()
+    return atlas
+
+def load_image(path):
+    """Load an image with alpha once and return the shared surface"""
+    image = _image_cache.get(path)
+    if image is None:
+        if _atlas is not None and path in _atlas:
+            image = _atlas.get(path)
+        else:
+            image = pygame.image.load(path).convert_alpha()
+        _image_cache[path] = image
+    return image
+
+def has_image(path):
+    """Check whether an image is already loaded, so it doesn't need decoding again"""
+    return path in _image_cache
+
+def add_image(path, image, opaque=None):
+    """
+    Put an already converted image in the cache, e.g. one decoded on a
+    worker thread, along with its opacity if that is known
+    """
+    _image_cache[path] = image
+    if opaque is not None:
+        _opaque_cache[path] = opaque
+
+def is_opaque(image):
+    """Check whether every pixel of an image is fully opaque. Releases the GIL, so it suits worker threads."""
+    alpha = pygame.image.tobytes(image, 'RGBA')[3::4]
+    return not alpha.strip(b'\xff')
+
+def image_opaque(path):
+    """Check whether a cached image is fully opaque, testing its pixels only the first time"""
+    opaque = _opaque_cache.get(path)
+    if opaque is None:
+        opaque = is_opaque(load_image(path))
+        _opaque_cache[path] = opaque
+    return opaque
+
+def load_tile_image(filename):
+    """Load a tile image from the tileset directory"""
+    return load_image(os.path.join(TILE_SET_PATH, filename))
+
+def load_tile_frames(filenames):
+    """Load a shared, read-only list of tile animation frames"""
+    key = tuple(filenames)
+    frames = _frame_cache.get(key)
+    if frames is None:
+        frames = [load_tile_image(filename) for filename in filenames]
+        _frame_cache[key] = frames
+    return frames
+
+def load_sprite_sheets(path, scale=1):
+    """
+    Load every state directory under path once, returning shared
+    (frames, flipped_frames) dicts of frame lists keyed by state name.
+    The flipped frames are mirrored horizontally for actors facing left.
+    """
+    key = (path, scale)
+    sheets = _sheet_cache.get(key)
+    if sheets is None:
+        frames = {}
+        flipped_frames = {}
+        for state in os.listdir(path):
+            state_path = os.path.join(path, state)
+            if os.path.isdir(state_path):
+                images = []
+                for frame in sorted(os.listdir(state_path)):
+                    if frame.endswith('.png'):
+                        image = load_image(os.path.join(state_path, frame))
+                        if scale != 1:
+                            new_width = image.get_width() * scale
+                            new_height = image.get_height() * scale
+                            image = pygame.transform.scale(image, (new_width, new_height))
+                        images.append(image)
+                frames[state] = images
+                flipped_frames[state] = [pygame.transform.flip(image, True, False) for image in images]
+        sheets = (frames, flipped_frames)
+        _sheet_cache[key] = sheets
+    return sheets
+
+def empty_tile_image():
+    """Get the shared transparent surface used for invisible tiles"""
+    image = _image_cache.get(None)
+    if image is None:
+        image = pygame.Surface((TILE_SIZE, TILE_SIZE), pygame.SRCALPHA)
+        _image_cache[None] = image
+    return image
+
+def clear_cache():
+    """Drop every cached surface, e.g. after the display mode changes"""
+    global _atlas
+    _atlas = None
+    _image_cache.clear()
+    _frame_cache.clear()
+    _sheet_cache.clear()
+    _opaque_cache.clear()
@@ -0,0 +1,280 @@
+"""
+Headless simulation and benchmark harness.
+
+Runs the game update loop without a window, real-time clock or keyboard:
+the SDL dummy video driver stands in for the display, every tick calls
+Game.update with the fixed simulation step as fast as possible, and the
+player is driven by a scripted input pattern or a recorded input stream.
+Reports ticks per second, the mean and tail time of each profiler scope
+and peak memory for each level.
+
+Usage:
+    python benchmark.py
+    python benchmark.py --ticks 5000 --levels level1 large --width 4000
+    python benchmark.py --check-batches
+"""
+
+import os
+
+# Must be set before pygame creates the display
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+
+import argparse
+import random
+import time
+import tracemalloc
+import pygame
+from settings import *
+from level_data import LEVEL_1, LEVEL_2
+from main import Game
+from enemy import Enemy, EnemyType
+import enemy_system
+from event_trace import tracer, TRACE_LEVEL_NAMES
+from profiler import profiler
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+# Scripted input as (ticks, keys held) steps, repeated for the whole run
+INPUT_SCRIPT = [
+    (120, {pygame.K_RIGHT}),
+    (30, {pygame.K_RIGHT, pygame.K_SPACE}),
+    (60, set()),
+    (120, {pygame.K_LEFT}),
+    (30, {pygame.K_LEFT, pygame.K_SPACE}),
+    (30, {pygame.K_UP}),
+]
+
+class ScriptedKeys:
+    """Input source standing in for pygame.key.get_pressed(), playing INPUT_SCRIPT by tick"""
+    def __init__(self, script=INPUT_SCRIPT):
+        self.script = script
+        self.length = sum(ticks for ticks, _ in script)
+        self.tick = 0
+        self.pressed = set()
+
+    def advance(self):
+        """Move to the next tick of the script"""
+        position = self.tick % self.length
+        for ticks, keys in self.script:
+            if position < ticks:
+                self.pressed = keys
+                break
+            position -= ticks
+        self.tick += 1
+
+    def __call__(self):
+        return self
+
+    def __getitem__(self, key):
+        return key in self.pressed
+
+def make_synthetic_level(width, height=40, seed=0):
+    """
+    Build a large level in the LEVEL_1 dictionary format: a walled box with
+    a solid floor, scattered platforms, ladders, spikes, coins and enemies
+    """
+    rng = random.Random(seed)
+    rows = [['0'] * width for _ in range(height)]
+    for col in range(width):
+        rows[0][col] = '1'
+        rows[height - 1][col] = '1'
+    for row in range(height):
+        rows[row][0] = '1'
+        rows[row][width - 1] = '1'
+
+    entities = [{'type': 'player_spawn', 'position': (3, height - 4)}]
+    enemy_types = ['walker', 'jumper', 'flyer']
+    for col in range(8, width - 8, 6):
+        # Platform run with an optional ladder up to it
+        row = rng.randrange(height - 12, height - 4)
+        run = rng.randrange(3, 8)
+        for offset in range(run):
+            if col + offset < width - 1:
+                rows[row][col + offset] = '2'
+        if rng.random() < 0.3:
+            for ladder_row in range(row, height - 1):
+                rows[ladder_row][col] = 'L'
+        # Floor details
+        floor_col = col + rng.randrange(0, 6)
+        if floor_col < width - 1:
+            rows[height - 2][floor_col] = rng.choice('SOO0')
+        if col % 30 == 8:
+            entities.append({
+                'type': 'enemy',
+                'enemy_type': rng.choice(enemy_types),
+                'position': (col, height - 6),
+                'properties': {},
+            })
+
+    return {
+        'name': f'Synthetic {width}',
+        'background_color': (50, 50, 100),
+        'background_tiles': [],
+        'main_layer': [''.join(row) for row in rows],
+        'entities': entities,
+        'tile_mapping': LEVEL_1['tile_mapping'],
+    }
+
+def load_level(game, level_data):
+    """Make level_data the only level of the game and set it up"""
+    game.levels = [level_data]
+    game.current_level = level_data
+    game.current_level_index = 0
+    game.game_over = False
+    game.game_complete = False
+    game.game_state = "game"
+    game.setup_game()
+
+def run_level(game, level_data, ticks, render=False, replay=None):
+    """Load and simulate one level, returning a dict of measurements"""
+    tracemalloc.start()
+    start = time.perf_counter()
+    load_level(game, level_data)
+    load_time = time.perf_counter() - start
+    _, load_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    keys = ScriptedKeys()
+    game.input_state.source = keys
+    if replay:
+        # Recorded input comes first, then the script takes over
+        game.input_state.load_replay(replay)
+    step = game.scheduler.step
+
+    # Per-subsystem times come from the scopes Game.update and draw_game mark,
+    # kept for every tick of the run
+    profiler.window = ticks
+    profiler.set_enabled(True)
+    profiler.clear()
+
+    clock = time.perf_counter
+    start = clock()
+    for _ in range(ticks):
+        keys.advance()
+        game.update(step)
+        if render:
+            game.draw_game()
+        profiler.end_frame()
+
+        if game.game_over:
+            # Keep the workload running rather than stopping at game over
+            game.game_over = False
+            game.player.lives = 3
+    elapsed = clock() - start
+
+    peak_rss = None
+    if resource:
+        # ru_maxrss is in kilobytes on Linux
+        peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    return {
+        'name': level_data['name'],
+        'tiles': len(game.tilemap.all_sprites),
+        'enemies': len(game.enemy_sprites),
+        'load_time': load_time,
+        'load_peak': load_peak / (1024 * 1024),
+        'ticks': ticks,
+        'ticks_per_sec': ticks / elapsed if elapsed else float('inf'),
+        'timings': profiler.stats(),
+        'peak_rss': peak_rss,
+    }
+
+def check_batches(game, level_data, ticks):
+    """
+    Move every enemy of a level both one sprite at a time and in a NumPy
+    EnemyBatch, and return the first tick and enemy where the two differ,
+    or None. Each spawn is also tried sunk half a tile into whatever is
+    below and beside it, so the batch's overlap resolution gets checked
+    against Enemy.check_collisions too.
+    """
+    load_level(game, level_data)
+    layer = game.tilemap.collision_layer
+    spawns = []
+    for entity in level_data['entities']:
+        if entity['type'] == 'enemy':
+            x, y = entity['position'][0] * TILE_SIZE, entity['position'][1] * TILE_SIZE
+            enemy_type = EnemyType(entity.get('enemy_type', 'walker'))
+            spawns += [(enemy_type, (x, y)), (enemy_type, (x + TILE_SIZE // 2, y + TILE_SIZE // 2))]
+
+    sprites = [Enemy(pos, enemy_type, [], game.tilemap.solid_tiles, layer) for enemy_type, pos in spawns]
+    batched = [Enemy(pos, enemy_type, [], game.tilemap.solid_tiles, layer) for enemy_type, pos in spawns]
+    batches = {}
+    for enemy in batched:
+        # Batch handles only need to be alive, not drawn
+        pygame.sprite.Group(enemy)
+        if enemy.enemy_type not in batches:
+            batches[enemy.enemy_type] = enemy_system.EnemyBatch(enemy.enemy_type, layer)
+        batches[enemy.enemy_type].add(enemy)
+
+    step = game.scheduler.step
+    for tick in range(ticks):
+        for enemy in sprites:
+            enemy.move(step)
+        for batch in batches.values():
+            batch.update(step)
+        for index, (sprite, handle) in enumerate(zip(sprites, batched)):
+            if (sprite.hitbox != handle.hitbox or sprite.direction != handle.direction
+                    or sprite.on_ground != handle.on_ground):
+                return tick, spawns[index], tuple(sprite.hitbox), tuple(handle.hitbox)
+    return None
+
+def print_report(result):
+    """Print one level's measurements"""
+    print(f"\n{result['name']}: {result['tiles']} tiles, {result['enemies']} enemies")
+    print(f"  load:        {result['load_time'] * 1000:8.1f} ms  (python heap peak {result['load_peak']:.1f} MB)")
+    print(f"  simulation:  {result['ticks_per_sec']:8.1f} ticks/sec over {result['ticks']} ticks")
+    print(f"    {'scope':<15} {'mean':>8} {'p95':>8} {'p99':>8}  us/tick")
+    for name, values in result['timings'].items():
+        print(f"    {name:<15} {values['mean'] * 1000:8.1f} {values['p95'] * 1000:8.1f} {values['p99'] * 1000:8.1f}")
+    if result['peak_rss'] is not None:
+        print(f"  process peak RSS: {result['peak_rss']:.1f} MB")
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the game headless and report simulation performance")
+    parser.add_argument('--ticks', type=int, default=2000, help="simulation ticks per level")
+    parser.add_argument('--levels', nargs='+', default=['level1', 'level2', 'large'],
+                        choices=['level1', 'level2', 'large'], help="levels to run")
+    parser.add_argument('--width', type=int, default=2000, help="width in tiles of the synthetic large level")
+    parser.add_argument('--render', action='store_true', help="also time drawing to the offscreen display")
+    parser.add_argument('--replay', metavar='PATH', help="drive the player from an input recording made with main.py --record")
+    parser.add_argument('--trace', choices=list(TRACE_LEVEL_NAMES), help="event trace level during the run")
+    parser.add_argument('--check-batches', action='store_true',
+                        help="check that batched enemies move exactly like per-sprite ones instead of benchmarking")
+    parser.add_argument('--trace-dump', metavar='PATH', default='trace.txt', help="file the event trace is written to")
+    args = parser.parse_args()
+
+    if args.trace:
+        tracer.set_level(TRACE_LEVEL_NAMES[args.trace])
+        tracer.dump_on_exit(args.trace_dump)
+
+    levels = {
+        'level1': LEVEL_1,
+        'level2': LEVEL_2,
+        'large': make_synthetic_level(args.width),
+    }
+
+    game = Game()
+    if args.check_batches:
+        if not enemy_system.available:
+            print("NumPy is not installed, enemies are never batched")
+            return
+        for name in args.levels:
+            mismatch = check_batches(game, levels[name], args.ticks)
+            if mismatch is None:
+                print(f"{levels[name]['name']}: batched and per-sprite enemies match over {args.ticks} ticks")
+            else:
+                tick, (enemy_type, pos), sprite, batched = mismatch
+                print(f"{levels[name]['name']}: {enemy_type.value} spawned at {pos} differs on tick {tick}: "
+                      f"per-sprite hitbox {sprite}, batched {batched}")
+        pygame.quit()
+        return
+    for name in args.levels:
+        print_report(run_level(game, levels[name], args.ticks, render=args.render, replay=args.replay))
+    pygame.quit()
+
+if __name__ == '__main__':
+    main()
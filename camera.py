@@ -1,9 +1,11 @@
 import pygame
 from settings import *
+from frame_scheduler import lerp_position
 
 class Camera:
     def __init__(self, width, height):
         self.camera = pygame.Rect(0, 0, width, height)
+        self.previous = None  # Offset before the last simulation step
         self.width = width
         self.height = height
         
@@ -28,6 +30,16 @@ class Camera:
         
         self.camera = pygame.Rect(x, y, self.width, self.height)
         
+    def save_previous(self):
+        """Remember the current offset as the previous simulation state"""
+        self.previous = self.camera.topleft
+
+    def interpolated(self, alpha):
+        """Get a Camera alpha of the way from the previous offset to the current one"""
+        camera = Camera(self.width, self.height)
+        camera.camera = pygame.Rect(lerp_position(self.previous, self.camera.topleft, alpha), (self.width, self.height))
+        return camera
+
     @property
     def x(self):
         """Get the camera's x position"""
@@ -37,3 +49,19 @@ class Camera:
     def y(self):
         """Get the camera's y position"""
         return self.camera.y
+
+    @property
+    def view_rect(self):
+        """Get the visible area of the level in world coordinates"""
+        return pygame.Rect(-self.camera.x, -self.camera.y, WINDOW_WIDTH, WINDOW_HEIGHT)
+
+    def activation_regions(self):
+        """
+        Get the (active, awake) areas around the view in world coordinates.
+        Enemies in the active area update every tick, those in the awake
+        area at a reduced rate, and the rest sleep.
+        """
+        view = self.view_rect
+        active = view.inflate(ENEMY_ACTIVE_MARGIN * 2, ENEMY_ACTIVE_MARGIN * 2)
+        awake = view.inflate(ENEMY_SLEEP_MARGIN * 2, ENEMY_SLEEP_MARGIN * 2)
+        return active, awake
@@ -0,0 +1,196 @@
+import re
+import pygame
+from settings import *
+from tile_types import TileType, TILE_PROPERTIES
+
+# Hitbox of a tile relative to its cell as (x, y, width, height).
+# Matches Tile.hitbox, which shrinks the tile rect by 10 pixels vertically.
+TILE_HITBOX = (0, 5, TILE_SIZE, TILE_SIZE - 10)
+
+# Per-type hitbox offsets, None for tiles without a hitbox
+HITBOX_OFFSETS = {
+    tile_type: TILE_HITBOX if properties.get('has_hitbox', False) else None
+    for tile_type, properties in TILE_PROPERTIES.items()
+}
+
+# Lookup from the stored byte back to the TileType
+TILE_TYPES_BY_VALUE = {tile_type.value: tile_type for tile_type in TileType}
+
+# Matches runs of empty cells in a layer
+EMPTY_RUN = re.compile(rb'\x00+')
+
+def swept_aabb(rect, dx, dy, target):
+    """
+    Sweep rect by (dx, dy) against a static target rect.
+    Returns (time, normal) for the moment the two first touch, where time
+    is the fraction of the move (0 to 1) and normal is the contact normal
+    on the target as (x, y). Returns None if they never touch during the
+    move, or if they already overlap at the start.
+    """
+    if dx > 0:
+        x_entry = (target.left - rect.right) / dx
+        x_exit = (target.right - rect.left) / dx
+    elif dx < 0:
+        x_entry = (target.right - rect.left) / dx
+        x_exit = (target.left - rect.right) / dx
+    elif rect.right <= target.left or rect.left >= target.right:
+        return None
+    else:
+        x_entry, x_exit = float('-inf'), float('inf')
+
+    if dy > 0:
+        y_entry = (target.top - rect.bottom) / dy
+        y_exit = (target.bottom - rect.top) / dy
+    elif dy < 0:
+        y_entry = (target.bottom - rect.top) / dy
+        y_exit = (target.top - rect.bottom) / dy
+    elif rect.bottom <= target.top or rect.top >= target.bottom:
+        return None
+    else:
+        y_entry, y_exit = float('-inf'), float('inf')
+
+    entry = max(x_entry, y_entry)
+    exit = min(x_exit, y_exit)
+    if entry > exit or entry < 0 or entry >= 1:
+        return None
+    if x_entry > y_entry:
+        return entry, (-1 if dx > 0 else 1, 0)
+    return entry, (0, -1 if dy > 0 else 1)
+
+def place_at_contact(rect, normal, target):
+    """Shift rect along a contact normal so it rests flush against target"""
+    left, right = sorted((rect.left, rect.right))
+    top, bottom = sorted((rect.top, rect.bottom))
+    if normal[0] < 0:
+        rect.x += target.left - right
+    elif normal[0] > 0:
+        rect.x += target.right - left
+    if normal[1] < 0:
+        rect.y += target.top - bottom
+    elif normal[1] > 0:
+        rect.y += target.bottom - top
+
+class CollisionLayer:
+    """
+    Dense grid of tile types stored one byte per cell.
+    Collision code resolves against this by direct cell lookup instead of
+    walking Tile sprites, so the cost of a query only depends on the size
+    of the rect being tested.
+    """
+    def __init__(self):
+        self.width = 0
+        self.height = 0
+        self.cells = bytearray()
+
+    def load_grids(self, *grids):
+        """
+        Fill the grid from same-sized compiled layer grids (see
+        level_compiler). Later grids take precedence where they are not empty.
+        """
+        self.width = grids[-1].width
+        self.height = grids[-1].height
+        self.cells = bytearray(grids[-1].cells)
+        # Fill the cells still empty from the layers below, one run at a time
+        for grid in reversed(grids[:-1]):
+            if grid.is_empty():
+                continue
+            for match in EMPTY_RUN.finditer(self.cells):
+                start, end = match.span()
+                self.cells[start:end] = grid.cells[start:end]
+
+    def get(self, col, row):
+        """Get the tile type at a cell, EMPTY outside the grid"""
+        if 0 <= col < self.width and 0 <= row < self.height:
+            return TILE_TYPES_BY_VALUE[self.cells[row * self.width + col]]
+        return TileType.EMPTY
+
+    def set(self, col, row, tile_type):
+        """Change the tile type at a cell, e.g. when a tile is removed"""
+        if 0 <= col < self.width and 0 <= row < self.height:
+            self.cells[row * self.width + col] = tile_type.value
+
+    def query(self, rect, tile_types, hitboxes=True):
+        """
+        Get (tile_type, rect) pairs for the cells of the given types that
+        overlap rect. Returns each tile's hitbox, or its full cell rect
+        when hitboxes is False. Callers still do the precise overlap test.
+        """
+        if rect.width < 0 or rect.height < 0:
+            # Inflated hitboxes can end up with negative sizes
+            rect = rect.copy()
+            rect.normalize()
+        values = {tile_type.value for tile_type in tile_types}
+        first_col = max(rect.left // TILE_SIZE, 0)
+        last_col = min((rect.right - 1) // TILE_SIZE, self.width - 1)
+        first_row = max(rect.top // TILE_SIZE, 0)
+        last_row = min((rect.bottom - 1) // TILE_SIZE, self.height - 1)
+
+        found = []
+        for row in range(first_row, last_row + 1):
+            offset = row * self.width
+            for col in range(first_col, last_col + 1):
+                value = self.cells[offset + col]
+                if value not in values:
+                    continue
+                tile_type = TILE_TYPES_BY_VALUE[value]
+                x, y = col * TILE_SIZE, row * TILE_SIZE
+                if not hitboxes:
+                    found.append((tile_type, pygame.Rect(x, y, TILE_SIZE, TILE_SIZE)))
+                    continue
+                hitbox = HITBOX_OFFSETS[tile_type]
+                if hitbox:
+                    found.append((tile_type, pygame.Rect(x + hitbox[0], y + hitbox[1], hitbox[2], hitbox[3])))
+        return found
+
+    def sweep(self, rect, dx, dy, tile_types, hitboxes=True):
+        """
+        Sweep rect by (dx, dy) through the grid against the tiles of the
+        given types. Returns (time, normal, tile_rect) for the first tile
+        hit, or None if the path is clear.
+        """
+        if rect.width < 0 or rect.height < 0:
+            rect = rect.copy()
+            rect.normalize()
+        # Every cell the rect passes through during the move
+        left = int(min(rect.left, rect.left + dx)) - 1
+        top = int(min(rect.top, rect.top + dy)) - 1
+        right = int(max(rect.right, rect.right + dx)) + 1
+        bottom = int(max(rect.bottom, rect.bottom + dy)) + 1
+        area = pygame.Rect(left, top, right - left, bottom - top)
+
+        first_hit = None
+        for _, tile_rect in self.query(area, tile_types, hitboxes):
+            hit = swept_aabb(rect, dx, dy, tile_rect)
+            if hit and (first_hit is None or hit[0] < first_hit[0]):
+                first_hit = (hit[0], hit[1], tile_rect)
+        return first_hit
+
+    def move(self, rect, dx, dy, tile_types, hitboxes=True):
+        """
+        Move rect in place by (dx, dy) along one axis, stopping flush
+        against the first tile of the given types in the way, so fast
+        movers cannot tunnel through thin tiles. Returns the contact normal,
+        or None if the whole move was made.
+
+        A move shorter than the rect plus the thinnest tile cannot pass
+        through a tile, so it is made whole without a sweep and contacts
+        are left to the caller's overlap resolution, as they always were.
+        Only moves long enough to tunnel are swept.
+        """
+        if hitboxes:
+            thickness = TILE_HITBOX[2] if dx else TILE_HITBOX[3]
+        else:
+            thickness = TILE_SIZE
+        extent = abs(rect.width) if dx else abs(rect.height)
+        if abs(dx or dy) < extent + thickness:
+            rect.x += dx
+            rect.y += dy
+            return None
+        hit = self.sweep(rect, dx, dy, tile_types, hitboxes)
+        if hit is None:
+            rect.x += dx
+            rect.y += dy
+            return None
+        _, normal, tile_rect = hit
+        place_at_contact(rect, normal, tile_rect)
+        return normal
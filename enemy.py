@@ -2,6 +2,8 @@ from enum import Enum
 import pygame
 import os
 from settings import *
+from tile_types import TileType
+from asset_cache import load_image
 
 class EnemyType(Enum):
     """Enum for different enemy types"""
@@ -50,8 +52,11 @@ ENEMY_PROPERTIES = {
     }
 }
 
+# Tile types enemies collide with, used for collision layer queries
+SOLID_TYPES = {TileType.SOLID}
+
 class Enemy(pygame.sprite.Sprite):
-    def __init__(self, pos, enemy_type, groups, collision_sprites):
+    def __init__(self, pos, enemy_type, groups, collision_sprites, collision_layer=None):
         super().__init__(groups)
         
         # Get properties for this enemy type
@@ -62,7 +67,7 @@ class Enemy(pygame.sprite.Sprite):
         sprite_path = os.path.join(ENEMY_SPRITES_PATH, self.properties['sprite_name'])
         try:
             if os.path.exists(sprite_path):
-                self.image = pygame.image.load(sprite_path).convert_alpha()
+                self.image = load_image(sprite_path)
             else:
                 self.image = pygame.Surface(self.properties['size'])
                 self.image.fill(self.properties['color'])
@@ -79,6 +84,9 @@ class Enemy(pygame.sprite.Sprite):
         self.speed = self.properties['speed']
         self.damage = self.properties['damage']
         
+        # Simulated time in milliseconds, for timers (see frame_scheduler)
+        self.time_ms = 0
+        
         # Movement
         self.direction = pygame.math.Vector2(1, 0)  # Start moving right
         self.gravity = GRAVITY if self.properties['affected_by_gravity'] else 0
@@ -96,35 +104,51 @@ class Enemy(pygame.sprite.Sprite):
             self.vertical_offset = 0
             self.vertical_direction = 1
         
+        # Batch that simulates this enemy, if any (see enemy_system)
+        self.batch = None
+        
         # Collision
         self.collision_sprites = collision_sprites
+        self.collision_layer = collision_layer  # Dense tile grid for direct cell lookups
 
     def move(self, dt):
+        """
+        Advance by dt seconds. Speeds are in pixels per simulation tick, so
+        a longer dt (an off-screen level of detail step) moves further.
+        """
+        ticks = dt * SIMULATION_RATE
+        self.time_ms += dt * 1000
         if self.properties['affected_by_gravity'] and not self.on_ground:
             self.direction.y += self.gravity * dt
         
         # Type-specific movement
         if self.enemy_type == EnemyType.FLYER:
             # Sinusoidal vertical movement
-            self.vertical_offset += self.properties['vertical_speed'] * self.vertical_direction
+            self.vertical_offset += self.properties['vertical_speed'] * self.vertical_direction * ticks
             if abs(self.vertical_offset) > self.properties['vertical_amplitude']:
                 self.vertical_direction *= -1
             self.direction.y = self.vertical_direction * self.properties['vertical_speed']
         elif self.enemy_type == EnemyType.JUMPER:
             # Jump when on ground and cooldown is ready
-            current_time = pygame.time.get_ticks()
-            if self.on_ground and current_time - self.last_jump > self.jump_cooldown:
+            if self.on_ground and self.time_ms - self.last_jump > self.jump_cooldown:
                 self.direction.y = self.properties['jump_force']
-                self.last_jump = current_time
+                self.last_jump = self.time_ms
                 self.on_ground = False
         
-        # Update position horizontally
-        self.hitbox.x += self.direction.x * self.speed
-        self.check_collisions('horizontal')
+        # Update position horizontally, turning around at walls
+        if self.sweep_move(self.direction.x * self.speed * ticks, 0):
+            self.direction.x *= -1
+        else:
+            self.check_collisions('horizontal')
         
         # Update position vertically
-        self.hitbox.y += self.direction.y
-        self.check_collisions('vertical')
+        normal = self.sweep_move(0, self.direction.y * ticks)
+        if normal:
+            if normal[1] < 0:  # Landed on top of a tile
+                self.on_ground = True
+            self.direction.y = 0
+        else:
+            self.check_collisions('vertical')
         
         # Update rect to match hitbox
         self.rect.center = self.hitbox.center
@@ -133,22 +157,39 @@ class Enemy(pygame.sprite.Sprite):
         if abs(self.hitbox.x - self.start_x) > self.patrol_distance:
             self.direction.x *= -1
 
+    def nearby_tiles(self):
+        """Get the rects of the solid tiles around the hitbox, using the collision layer when available"""
+        if self.collision_layer is None:
+            return [sprite.rect for sprite in self.collision_sprites.sprites()]
+        return [rect for _, rect in self.collision_layer.query(self.hitbox, SOLID_TYPES, hitboxes=False)]
+
+    def sweep_move(self, dx, dy):
+        """
+        Move the hitbox by (dx, dy) along one axis, stopping flush against
+        the first solid tile in the way. Returns the contact normal, or None.
+        """
+        if self.collision_layer is None:
+            self.hitbox.x += dx
+            self.hitbox.y += dy
+            return None
+        return self.collision_layer.move(self.hitbox, dx, dy, SOLID_TYPES, hitboxes=False)
+
     def check_collisions(self, direction):
-        for sprite in self.collision_sprites.sprites():
-            if sprite.rect.colliderect(self.hitbox):
+        for rect in self.nearby_tiles():
+            if rect.colliderect(self.hitbox):
                 if direction == 'horizontal':
                     if self.direction.x > 0:
-                        self.hitbox.right = sprite.rect.left
+                        self.hitbox.right = rect.left
                     else:
-                        self.hitbox.left = sprite.rect.right
+                        self.hitbox.left = rect.right
                     self.direction.x *= -1
                 else:  # vertical
                     if self.direction.y > 0:
-                        self.hitbox.bottom = sprite.rect.top
+                        self.hitbox.bottom = rect.top
                         self.direction.y = 0
                         self.on_ground = True
                     else:
-                        self.hitbox.top = sprite.rect.bottom
+                        self.hitbox.top = rect.bottom
                         self.direction.y = 0
 
     def take_damage(self, amount):
@@ -156,4 +197,6 @@ class Enemy(pygame.sprite.Sprite):
         return self.health <= 0
 
     def update(self, dt):
-        self.move(dt)
+        # Enemies handed to the enemy system are moved by their batch instead
+        if self.batch is None:
+            self.move(dt)
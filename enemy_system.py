@@ -0,0 +1,405 @@
+"""
+Batched enemy simulation.
+
+Stores the state of every enemy of one EnemyType in NumPy arrays and runs
+WALKER patrols, JUMPER cooldown jumps and FLYER oscillation as vectorized
+steps over the whole batch. The Enemy sprites stay around as handles: the
+batch writes their rect and hitbox back after each step, so rendering and
+spritecollide damage checks work unchanged.
+
+Enemies are only simulated near the camera: those inside the active
+region (see Camera.activation_regions) update every tick, those in the
+awake region every ENEMY_LOD_INTERVAL ticks with one step as long as the
+ticks they skipped, and the rest sleep until the camera comes close again.
+
+Vectorizing has a fixed cost per step, so a type only moves to a NumPy
+batch once it has ENEMY_BATCH_MIN_SIZE enemies; smaller groups are moved
+one sprite at a time by a SpriteBatch, with the same activation regions.
+NumPy is optional. Without it, `available` is False and every type stays
+in a SpriteBatch.
+"""
+
+import math
+import pygame
+from settings import *
+from tile_types import TileType
+from enemy import EnemyType
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+available = np is not None
+
+def lod_ticks(tick, in_active, in_awake):
+    """
+    Level of detail rule: how many ticks of time to advance an enemy by on
+    this tick. 1 when active; ENEMY_LOD_INTERVAL every ENEMY_LOD_INTERVAL
+    ticks when awake, making up for the skipped ones; otherwise 0.
+    """
+    if in_active:
+        return 1
+    if in_awake and tick % ENEMY_LOD_INTERVAL == 0:
+        return ENEMY_LOD_INTERVAL
+    return 0
+
+def round_like_rect(values):
+    """
+    Round to whole pixels, halves away from zero, the way Rect attributes
+    round assigned floats, so batched enemies move like per-sprite ones
+    """
+    return np.copysign(np.floor(np.abs(values) + 0.5), values)
+
+class EnemyBatch:
+    """All enemies of one EnemyType, simulated together"""
+    def __init__(self, enemy_type, collision_layer):
+        self.enemy_type = enemy_type
+        self.collision_layer = collision_layer
+        self.handles = []
+        self.live = pygame.sprite.Group()  # Killed handles drop out of this
+        self.dirty = False
+        self.grid_source = None
+        self.grid = None
+
+    def add(self, enemy):
+        """Take over updating an Enemy sprite"""
+        enemy.batch = self
+        self.handles.append(enemy)
+        self.live.add(enemy)
+        self.dirty = True
+
+    def load_arrays(self):
+        """Pull the current state of every live handle into arrays"""
+        self.handles = [enemy for enemy in self.handles if enemy.alive()]
+        handles = self.handles
+        self.x = np.array([enemy.hitbox.x for enemy in handles], dtype=float)
+        self.y = np.array([enemy.hitbox.y for enemy in handles], dtype=float)
+        self.w = np.array([enemy.hitbox.width for enemy in handles], dtype=np.int64)
+        self.h = np.array([enemy.hitbox.height for enemy in handles], dtype=np.int64)
+        self.dir_x = np.array([enemy.direction.x for enemy in handles], dtype=float)
+        self.vy = np.array([enemy.direction.y for enemy in handles], dtype=float)
+        self.speed = np.array([enemy.speed for enemy in handles], dtype=float)
+        self.start_x = np.array([enemy.start_x for enemy in handles], dtype=float)
+        self.patrol_distance = np.array([enemy.patrol_distance for enemy in handles], dtype=float)
+        self.on_ground = np.array([enemy.on_ground for enemy in handles], dtype=bool)
+        if self.enemy_type == EnemyType.JUMPER:
+            self.last_jump = np.array([enemy.last_jump for enemy in handles], dtype=float)
+            self.time_ms = np.array([enemy.time_ms for enemy in handles], dtype=float)
+        elif self.enemy_type == EnemyType.FLYER:
+            self.vertical_offset = np.array([enemy.vertical_offset for enemy in handles], dtype=float)
+            self.vertical_direction = np.array([enemy.vertical_direction for enemy in handles], dtype=float)
+        self.dirty = False
+
+    def state_fields(self):
+        """Names of the per-enemy state arrays"""
+        fields = ['x', 'y', 'w', 'h', 'dir_x', 'vy', 'speed', 'start_x', 'patrol_distance', 'on_ground']
+        if self.enemy_type == EnemyType.JUMPER:
+            fields += ['last_jump', 'time_ms']
+        elif self.enemy_type == EnemyType.FLYER:
+            fields += ['vertical_offset', 'vertical_direction']
+        return fields
+
+    def store_arrays(self, index=None):
+        """Write positions and movement state back to the handles, or only those at index"""
+        if index is None:
+            handles = self.handles
+            index = slice(None)
+        else:
+            handles = [self.handles[i] for i in index.tolist()]
+        xs = self.x[index].astype(np.int64).tolist()
+        ys = self.y[index].astype(np.int64).tolist()
+        dir_x = self.dir_x[index].tolist()
+        vy = self.vy[index].tolist()
+        on_ground = self.on_ground[index].tolist()
+        for position, enemy in enumerate(handles):
+            enemy.hitbox.topleft = (xs[position], ys[position])
+            enemy.rect.center = enemy.hitbox.center
+            enemy.direction.update(dir_x[position], vy[position])
+            enemy.on_ground = on_ground[position]
+        if self.enemy_type == EnemyType.JUMPER:
+            for enemy, last_jump, time_ms in zip(handles, self.last_jump[index].tolist(), self.time_ms[index].tolist()):
+                enemy.last_jump = last_jump
+                enemy.time_ms = time_ms
+        elif self.enemy_type == EnemyType.FLYER:
+            state = zip(handles, self.vertical_offset[index].tolist(), self.vertical_direction[index].tolist())
+            for enemy, vertical_offset, vertical_direction in state:
+                enemy.vertical_offset = vertical_offset
+                enemy.vertical_direction = vertical_direction
+
+    def solid_grid(self):
+        """Zero-copy 2D view of the collision layer, refreshed when the layer is reloaded"""
+        layer = self.collision_layer
+        if self.grid_source is not layer.cells:
+            self.grid_source = layer.cells
+            self.grid = np.frombuffer(layer.cells, dtype=np.uint8).reshape(layer.height, layer.width)
+        return self.grid
+
+    def solid_in_span(self, fixed, span_start, span_end, fixed_is_col):
+        """
+        For each enemy, check whether any cell along one column (or row) is
+        solid between span_start and span_end, both in cells and inclusive.
+        Cells outside the grid count as empty.
+        """
+        grid = self.solid_grid()
+        height, width = grid.shape
+        span_length = int((span_end - span_start).max(initial=0)) + 1
+        offsets = np.arange(span_length)
+        span = span_start[:, None] + offsets[None, :]
+        in_span = span <= span_end[:, None]
+        fixed = np.broadcast_to(fixed[:, None], span.shape)
+        cols, rows = (fixed, span) if fixed_is_col else (span, fixed)
+        inside = in_span & (cols >= 0) & (cols < width) & (rows >= 0) & (rows < height)
+        solid = np.zeros(span.shape, dtype=bool)
+        solid[inside] = grid[rows[inside], cols[inside]] == TileType.SOLID.value
+        return solid.any(axis=1)
+
+    def move_horizontal(self, dx):
+        """
+        Move by dx, turning around against solid tiles. Positions are left
+        unrounded so a move split into steps ends where one sweep would.
+        """
+        new_x = self.x + dx
+        right = dx > 0
+        left = dx < 0
+        lead_col = np.where(right, np.ceil(new_x + self.w) - 1, np.floor(new_x)).astype(np.int64) // TILE_SIZE
+        left_col = np.floor(self.x).astype(np.int64) // TILE_SIZE
+        right_col = (np.ceil(self.x + self.w).astype(np.int64) - 1) // TILE_SIZE
+        top_row = np.floor(self.y).astype(np.int64) // TILE_SIZE
+        bottom_row = (np.ceil(self.y + self.h).astype(np.int64) - 1) // TILE_SIZE
+        # Like the sweep, tiles the hitbox already overlaps don't stop it; resolve_overlaps pushes it out
+        entering = (right & (lead_col > right_col)) | (left & (lead_col < left_col))
+        hit = entering & self.solid_in_span(lead_col, top_row, bottom_row, fixed_is_col=True)
+        new_x = np.where(hit & right, lead_col * TILE_SIZE - self.w, new_x)
+        new_x = np.where(hit & left, (lead_col + 1) * TILE_SIZE, new_x)
+        self.x = new_x
+        self.dir_x = np.where(hit, -self.dir_x, self.dir_x)
+        return hit
+
+    def move_vertical(self, dy):
+        """Move by dy, landing on or bumping into solid tiles, leaving positions unrounded like move_horizontal"""
+        new_y = self.y + dy
+        down = dy > 0
+        up = dy < 0
+        lead_row = np.where(down, np.ceil(new_y + self.h) - 1, np.floor(new_y)).astype(np.int64) // TILE_SIZE
+        left_col = np.floor(self.x).astype(np.int64) // TILE_SIZE
+        right_col = (np.ceil(self.x + self.w).astype(np.int64) - 1) // TILE_SIZE
+        top_row = np.floor(self.y).astype(np.int64) // TILE_SIZE
+        bottom_row = (np.ceil(self.y + self.h).astype(np.int64) - 1) // TILE_SIZE
+        entering = (down & (lead_row > bottom_row)) | (up & (lead_row < top_row))
+        hit = entering & self.solid_in_span(lead_row, left_col, right_col, fixed_is_col=False)
+        new_y = np.where(hit & down, lead_row * TILE_SIZE - self.h, new_y)
+        new_y = np.where(hit & up, (lead_row + 1) * TILE_SIZE, new_y)
+        self.y = new_y
+        self.vy = np.where(hit, 0.0, self.vy)
+        self.on_ground = self.on_ground | (hit & down)
+        return hit
+
+    def resolve_overlaps(self, mask, horizontal):
+        """
+        Push the enemies in mask out of the solid tiles they overlap, the
+        vectorized form of Enemy.check_collisions: the cells under each
+        hitbox are visited row by row, and each one still overlapping
+        pushes the hitbox out against the direction of travel.
+        """
+        grid = self.solid_grid()
+        height, width = grid.shape
+        x = self.x.astype(np.int64)
+        y = self.y.astype(np.int64)
+        # The cells are picked from the hitbox before any push, like Enemy.nearby_tiles
+        first_col = np.maximum(x // TILE_SIZE, 0)
+        last_col = np.minimum((x + self.w - 1) // TILE_SIZE, width - 1)
+        first_row = np.maximum(y // TILE_SIZE, 0)
+        last_row = np.minimum((y + self.h - 1) // TILE_SIZE, height - 1)
+        mask = mask & (first_col <= last_col) & (first_row <= last_row)
+        if not mask.any():
+            return
+        for row_offset in range(int((last_row - first_row)[mask].max()) + 1):
+            row = first_row + row_offset
+            for col_offset in range(int((last_col - first_col)[mask].max()) + 1):
+                col = first_col + col_offset
+                candidate = mask & (row <= last_row) & (col <= last_col)
+                index = np.flatnonzero(candidate)
+                candidate[index] = grid[row[index], col[index]] == TileType.SOLID.value
+                left = col * TILE_SIZE
+                top = row * TILE_SIZE
+                overlap = (candidate & (self.x < left + TILE_SIZE) & (self.x + self.w > left) &
+                           (self.y < top + TILE_SIZE) & (self.y + self.h > top))
+                if not overlap.any():
+                    continue
+                if horizontal:
+                    pushed_x = np.where(self.dir_x > 0, left - self.w, left + TILE_SIZE)
+                    self.x = np.where(overlap, pushed_x, self.x)
+                    self.dir_x = np.where(overlap, -self.dir_x, self.dir_x)
+                else:
+                    falling = self.vy > 0
+                    pushed_y = np.where(falling, top - self.h, top + TILE_SIZE)
+                    self.y = np.where(overlap, pushed_y, self.y)
+                    self.vy = np.where(overlap, 0.0, self.vy)
+                    self.on_ground = self.on_ground | (overlap & falling)
+
+    def overlaps(self, rect):
+        """Mask of the enemies whose hitbox overlaps rect"""
+        return ((self.x < rect.right) & (self.x + self.w > rect.left) &
+                (self.y < rect.bottom) & (self.y + self.h > rect.top))
+
+    def update(self, dt, regions=None, tick=0):
+        """
+        Advance the enemies in the batch by one step. With (active, awake)
+        regions, each enemy advances by the ticks lod_ticks gives it.
+        """
+        if self.dirty:
+            self.load_arrays()
+        if not self.handles:
+            return
+        if len(self.live) != len(self.handles):
+            self.load_arrays()
+
+        if regions is None:
+            self.step(dt)
+            self.store_arrays()
+            return
+        active, awake = regions
+        in_active = self.overlaps(active)
+        self.step_selected(in_active, dt)
+        if tick % ENEMY_LOD_INTERVAL == 0:
+            # Awake enemies make up for the ticks they skipped in one longer step
+            self.step_selected(self.overlaps(awake) & ~in_active, dt * ENEMY_LOD_INTERVAL)
+
+    def step_selected(self, mask, dt):
+        """Step only the enemies in a mask, then scatter their state back"""
+        if mask.all():
+            self.step(dt)
+            self.store_arrays()
+            return
+        index = np.flatnonzero(mask)
+        if not len(index):
+            return
+        full = {name: getattr(self, name) for name in self.state_fields()}
+        for name, values in full.items():
+            setattr(self, name, values[index])
+        self.step(dt)
+        for name, values in full.items():
+            values[index] = getattr(self, name)
+            setattr(self, name, values)
+        self.store_arrays(index)
+
+    def step(self, dt):
+        """Move every enemy in the arrays by dt seconds (speeds are per tick, like Enemy.move)"""
+        ticks = dt * SIMULATION_RATE
+        properties = self.handles[0].properties
+        if properties['affected_by_gravity']:
+            self.vy = np.where(self.on_ground, self.vy, self.vy + GRAVITY * dt)
+
+        # Type-specific movement
+        if self.enemy_type == EnemyType.FLYER:
+            # Sinusoidal vertical movement
+            self.vertical_offset += properties['vertical_speed'] * self.vertical_direction * ticks
+            turn = np.abs(self.vertical_offset) > properties['vertical_amplitude']
+            self.vertical_direction = np.where(turn, -self.vertical_direction, self.vertical_direction)
+            self.vy = self.vertical_direction * properties['vertical_speed']
+        elif self.enemy_type == EnemyType.JUMPER:
+            # Jump when on ground and cooldown is ready
+            # Timed on each enemy's simulated clock, like Enemy.move
+            self.time_ms = self.time_ms + dt * 1000
+            jump = self.on_ground & (self.time_ms - self.last_jump > properties['jump_cooldown'])
+            self.vy = np.where(jump, properties['jump_force'], self.vy)
+            self.last_jump = np.where(jump, self.time_ms, self.last_jump)
+            self.on_ground = self.on_ground & ~jump
+
+        # Like CollisionLayer.move, only moves long enough to pass through a tile
+        # are swept, in steps shorter than a tile; shorter moves are made whole
+        # and contacts left to resolve_overlaps
+        dx = self.dir_x * self.speed * ticks
+        swept = np.abs(dx) >= self.w + TILE_SIZE
+        self.x = self.x + np.where(swept, 0.0, dx)
+        dx = np.where(swept, dx, 0.0)
+        steps = max(1, math.ceil(float(np.abs(dx).max()) / (TILE_SIZE - 1)))
+        dx = dx / steps
+        turned = np.zeros(len(dx), dtype=bool)
+        for _ in range(steps):
+            # Enemies that turned around stop for the rest of this tick
+            hit = self.move_horizontal(dx)
+            turned |= hit
+            dx = np.where(hit, 0.0, dx)
+        self.x = round_like_rect(self.x)
+        self.resolve_overlaps(~turned, horizontal=True)
+        dy = self.vy * ticks
+        swept = np.abs(dy) >= self.h + TILE_SIZE
+        self.y = self.y + np.where(swept, 0.0, dy)
+        dy = np.where(swept, dy, 0.0)
+        steps = max(1, math.ceil(float(np.abs(dy).max()) / (TILE_SIZE - 1)))
+        dy = dy / steps
+        stopped = np.zeros(len(dy), dtype=bool)
+        for _ in range(steps):
+            stopped |= self.move_vertical(np.where(self.vy == 0, 0.0, dy))
+        self.y = round_like_rect(self.y)
+        self.resolve_overlaps(~stopped, horizontal=False)
+
+        # Check patrol boundaries for horizontal movement
+        outside = np.abs(self.x - self.start_x) > self.patrol_distance
+        self.dir_x = np.where(outside, -self.dir_x, self.dir_x)
+
+class SpriteBatch:
+    """Enemies moved one sprite at a time, for small groups or when NumPy is not available"""
+    def __init__(self):
+        self.handles = []
+        self.live = pygame.sprite.Group()
+
+    def add(self, enemy):
+        """Take over updating an Enemy sprite"""
+        enemy.batch = self
+        self.handles.append(enemy)
+        self.live.add(enemy)
+
+    def update(self, dt, regions=None, tick=0):
+        """Move each enemy by the ticks lod_ticks gives it on this tick"""
+        if len(self.live) != len(self.handles):
+            self.handles = [enemy for enemy in self.handles if enemy.alive()]
+        if regions is None:
+            for enemy in self.handles:
+                enemy.move(dt)
+            return
+        active, awake = regions
+        for enemy in self.handles:
+            ticks = lod_ticks(tick, active.colliderect(enemy.hitbox), awake.colliderect(enemy.hitbox))
+            if ticks:
+                enemy.move(dt * ticks)
+
+class EnemySystem:
+    """Batches of enemies, one per EnemyType"""
+    def __init__(self, collision_layer):
+        self.collision_layer = collision_layer
+        self.batches = {}
+
+    def add(self, enemy):
+        """
+        Hand an Enemy over to the batch for its type. A type moves from a
+        SpriteBatch to a NumPy EnemyBatch once it has ENEMY_BATCH_MIN_SIZE
+        live enemies.
+        """
+        key = enemy.enemy_type
+        batch = self.batches.get(key)
+        if batch is None:
+            batch = SpriteBatch()
+            self.batches[key] = batch
+        batch.add(enemy)
+        if available and isinstance(batch, SpriteBatch) and len(batch.live) >= ENEMY_BATCH_MIN_SIZE:
+            vectorized = EnemyBatch(key, self.collision_layer)
+            for handle in batch.handles:
+                if handle.alive():
+                    vectorized.add(handle)
+            self.batches[key] = vectorized
+
+    def clear(self):
+        """Kill every enemy in the system and drop the batches, e.g. before loading another level"""
+        for batch in self.batches.values():
+            for enemy in batch.handles:
+                enemy.batch = None
+                enemy.kill()
+        self.batches.clear()
+
+    def update(self, dt, regions=None, tick=0):
+        """Step every batch, limited to the (active, awake) regions if given"""
+        for batch in self.batches.values():
+            batch.update(dt, regions, tick)
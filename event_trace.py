@@ -0,0 +1,68 @@
+import atexit
+import time
+from collections import deque
+from settings import *
+
+# Trace levels, from quietest to most detailed
+TRACE_OFF = 0
+TRACE_INFO = 1
+TRACE_DEBUG = 2
+
+TRACE_LEVEL_NAMES = {'off': TRACE_OFF, 'info': TRACE_INFO, 'debug': TRACE_DEBUG}
+
+class EventTrace:
+    """
+    Low-overhead event trace for hot code paths.
+    Events are stored unformatted as (timestamp, name, args) in a ring
+    buffer and only turned into text when the buffer is dumped. Hot paths
+    guard each call with the `info` or `debug` flag so a disabled trace
+    costs one attribute check. Each event name can be sampled so only
+    every Nth occurrence is kept.
+    """
+    def __init__(self, level=TRACE_OFF, capacity=4096, sample_rate=1):
+        self.events = deque(maxlen=capacity)
+        self.sample_rate = max(1, sample_rate)
+        self.counts = {}
+        self.dump_path = None
+        self.set_level(level)
+
+    def set_level(self, level):
+        """Change the trace level and refresh the guard flags"""
+        self.level = level
+        self.info = level >= TRACE_INFO
+        self.debug = level >= TRACE_DEBUG
+
+    def record(self, event, *args):
+        """Store an event, keeping only every sample_rate-th one per name"""
+        count = self.counts.get(event, 0)
+        self.counts[event] = count + 1
+        if count % self.sample_rate == 0:
+            self.events.append((time.perf_counter_ns(), event, args))
+
+    def clear(self):
+        """Drop all buffered events and counters"""
+        self.events.clear()
+        self.counts.clear()
+
+    def dump(self, path=None):
+        """Write the buffered events as text lines to path (or dump_path)"""
+        path = path or self.dump_path
+        if not path or not self.events:
+            return
+        start = self.events[0][0]
+        with open(path, 'w') as file:
+            for timestamp, event, args in self.events:
+                values = ' '.join(str(arg) for arg in args)
+                file.write(f"{(timestamp - start) / 1_000_000:10.3f} ms  {event} {values}\n")
+            file.write(f"# event counts: {self.counts}\n")
+
+    def dump_on_exit(self, path):
+        """Dump the buffer to path when the process exits"""
+        if self.dump_path is None:
+            atexit.register(self.dump)
+        self.dump_path = path
+
+# Shared trace used by the game code
+tracer = EventTrace(TRACE_LEVEL, TRACE_CAPACITY, TRACE_SAMPLE_RATE)
+if TRACE_DUMP_PATH:
+    tracer.dump_on_exit(TRACE_DUMP_PATH)
@@ -0,0 +1,74 @@
+"""
+Frame pacing for the main loop.
+
+Simulation runs in fixed steps of 1 / SIMULATION_RATE seconds no matter
+how long frames take. Elapsed time is collected in an accumulator and spent
+one step at a time, with at most MAX_STEPS_PER_FRAME steps per frame, so a
+hitch is dropped instead of being fed into physics as one huge step.
+Rendering is capped at RENDER_FPS while playing and at IDLE_FPS on screens
+that don't simulate. alpha tells how far the time left in the accumulator
+is between the last two simulation states, for interpolated drawing.
+
+Gameplay timers (invulnerability, portal cooldowns, jumper jumps) run on
+simulated time too: the player and each enemy add up the dt of the steps
+they are given in a time_ms attribute, and timers compare against that
+instead of the wall clock. Replaying the same input then plays out the
+same way whatever the frame rate.
+"""
+
+from settings import *
+
+def lerp_position(previous, current, alpha, snap_distance=INTERPOLATION_SNAP_DISTANCE):
+    """
+    Get the pixel position alpha of the way from previous to current.
+    Jumps longer than snap_distance (respawns, portals, level loads) and
+    unknown previous positions snap straight to current.
+    """
+    if previous is None:
+        return current
+    dx = current[0] - previous[0]
+    dy = current[1] - previous[1]
+    if abs(dx) > snap_distance or abs(dy) > snap_distance:
+        return current
+    return (round(previous[0] + dx * alpha), round(previous[1] + dy * alpha))
+
+class FrameScheduler:
+    """Fixed-timestep accumulator and render rate cap around a pygame Clock"""
+    def __init__(self, clock, simulation_rate=SIMULATION_RATE, render_fps=RENDER_FPS,
+                 idle_fps=IDLE_FPS, max_steps=MAX_STEPS_PER_FRAME):
+        self.clock = clock
+        self.step = 1 / simulation_rate  # Seconds simulated by each step
+        self.render_fps = render_fps
+        self.idle_fps = idle_fps
+        self.max_steps = max_steps
+        self.accumulator = 0.0
+        self.frame_time = 0.0  # Wall time of the last frame, in seconds
+        self.resync = True  # Start the next simulated frame with one step instead of catching up
+
+    def begin_frame(self, simulating=True):
+        """
+        Wait out the rest of the frame at the render cap (the idle cap when
+        not simulating) and return how many simulation steps to run
+        """
+        fps = self.render_fps if simulating else self.idle_fps
+        self.frame_time = self.clock.tick(fps) / 1000
+        if not simulating:
+            self.resync = True
+            return 0
+        if self.resync:
+            self.resync = False
+            self.accumulator = self.step
+        else:
+            self.accumulator = min(self.accumulator + self.frame_time, self.step * self.max_steps)
+        steps = int(self.accumulator / self.step)
+        self.accumulator -= steps * self.step
+        return steps
+
+    def reset(self):
+        """Drop the time built up so far, e.g. after loading a level"""
+        self.resync = True
+
+    @property
+    def alpha(self):
+        """Fraction of a step between the previous simulation state and the current one"""
+        return min(self.accumulator / self.step, 1.0)
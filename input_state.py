@@ -0,0 +1,69 @@
+import pygame
+import struct
+
+# Keys the game reads, in bit order of the packed per-tick record
+TRACKED_KEYS = (pygame.K_LEFT, pygame.K_RIGHT, pygame.K_UP, pygame.K_DOWN, pygame.K_SPACE)
+KEY_BITS = {key: 1 << index for index, key in enumerate(TRACKED_KEYS)}
+
+# Recording file layout: magic, format version, tick count, then one byte per tick
+RECORDING_MAGIC = b'PFIN'
+RECORDING_VERSION = 1
+RECORDING_HEADER = struct.Struct('<4sBI')
+
+class InputState:
+    """
+    Keyboard state sampled once per tick.
+    All input consumers index this object like the result of
+    pygame.key.get_pressed(), so the keyboard is polled only once per tick.
+    Each tick is packed into a single byte, which makes it cheap to record
+    a session to a file and replay it later.
+    """
+    def __init__(self, source=pygame.key.get_pressed):
+        self.source = source  # Callable returning the pressed-key state
+        self.bits = 0
+        self.tick = 0
+        self.recording = None
+        self.replay = None
+
+    def sample(self):
+        """Read the input for the next tick, from the replay if one is loaded"""
+        if self.replay is not None and self.tick < len(self.replay):
+            self.bits = self.replay[self.tick]
+        else:
+            keys = self.source()
+            self.bits = 0
+            for key, bit in KEY_BITS.items():
+                if keys[key]:
+                    self.bits |= bit
+        if self.recording is not None:
+            self.recording.append(self.bits)
+        self.tick += 1
+
+    def __getitem__(self, key):
+        return bool(self.bits & KEY_BITS.get(key, 0))
+
+    def replay_finished(self):
+        """Check whether a loaded replay has run out of ticks"""
+        return self.replay is not None and self.tick >= len(self.replay)
+
+    def start_recording(self):
+        """Start keeping every sampled tick"""
+        self.recording = bytearray()
+
+    def save_recording(self, path):
+        """Write the recorded ticks to a binary file"""
+        if self.recording is None:
+            return
+        with open(path, 'wb') as file:
+            file.write(RECORDING_HEADER.pack(RECORDING_MAGIC, RECORDING_VERSION, len(self.recording)))
+            file.write(self.recording)
+
+    def load_replay(self, path):
+        """Load a recording and play it back from the first tick"""
+        with open(path, 'rb') as file:
+            header = file.read(RECORDING_HEADER.size)
+            magic, version, ticks = RECORDING_HEADER.unpack(header)
+            if magic != RECORDING_MAGIC or version != RECORDING_VERSION:
+                raise ValueError(f"{path} is not a version {RECORDING_VERSION} input recording")
+            self.replay = file.read(ticks)
+        self.tick = 0
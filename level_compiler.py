@@ -0,0 +1,175 @@
+"""
+Compiled binary level format.
+
+Turns the dictionary levels from level_data.py into a compact file: a
+header, one uint8 grid of TileType values per layer and a JSON entity
+table. Compiled files are cached in LEVEL_CACHE_DIR under a hash of the
+level source, so a level is only compiled again when it changes. Loading
+memory-maps the file and exposes the layer grids without copying them.
+
+File layout:
+    header   magic, format version, layer count, width, height, entity table size
+    layers   width * height bytes per layer, row-major, background then main
+    entities UTF-8 JSON list of the level's entities
+"""
+
+import os
+import re
+import json
+import mmap
+import struct
+import hashlib
+import threading
+from settings import *
+from collision_layer import TILE_TYPES_BY_VALUE
+
+LEVEL_MAGIC = b'PFLV'
+LEVEL_VERSION = 1
+LEVEL_HEADER = struct.Struct('<4sBHIII')
+
+# Matches every cell that holds a tile
+NON_EMPTY_CELL = re.compile(rb'[^\x00]')
+
+def source_hash(level_data):
+    """Hash of everything in the level dictionary that ends up in the compiled file"""
+    source = {
+        'version': LEVEL_VERSION,
+        'main_layer': level_data['main_layer'],
+        'background_tiles': level_data.get('background_tiles', []),
+        'entities': level_data.get('entities', []),
+        'tile_mapping': {char: tile_type.value for char, tile_type in level_data['tile_mapping'].items()},
+    }
+    encoded = json.dumps(source, sort_keys=True, default=str).encode('utf-8')
+    return hashlib.sha1(encoded).hexdigest()
+
+def compile_level(level_data):
+    """Compile a level dictionary to the bytes of a level file"""
+    # Byte translation table from level characters to TileType values
+    table = bytearray(256)
+    for char, tile_type in level_data['tile_mapping'].items():
+        if ord(char) < 256:
+            table[ord(char)] = tile_type.value
+
+    layers = [level_data.get('background_tiles', []), level_data['main_layer']]
+    width = max((len(row) for layer in layers for row in layer), default=0)
+    height = max(len(layer) for layer in layers)
+
+    grids = []
+    for layer in layers:
+        grid = bytearray()
+        for row in layer:
+            # Characters outside the mapping become EMPTY, like parse_level_data
+            grid += row.encode('latin-1', 'replace').translate(table).ljust(width, b'\0')
+        grid += bytes(width * (height - len(layer)))
+        grids.append(grid)
+
+    entities = json.dumps(level_data.get('entities', [])).encode('utf-8')
+    header = LEVEL_HEADER.pack(LEVEL_MAGIC, LEVEL_VERSION, len(grids), width, height, len(entities))
+    return header + b''.join(grids) + entities
+
+def cache_path(level_data):
+    """Path of the cached compiled file for a level"""
+    return os.path.join(LEVEL_CACHE_DIR, f"{source_hash(level_data)}.lvl")
+
+def load_compiled_level(level_data):
+    """
+    Get the compiled form of a level dictionary, compiling it into the
+    cache first if needed. Falls back to an in-memory copy when the cache
+    directory cannot be written.
+    """
+    path = cache_path(level_data)
+    if not os.path.exists(path):
+        data = compile_level(level_data)
+        try:
+            os.makedirs(LEVEL_CACHE_DIR, exist_ok=True)
+            temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temp_path, 'wb') as file:
+                file.write(data)
+            os.replace(temp_path, path)
+        except OSError:
+            return CompiledLevel(data)
+    return CompiledLevel.open(path)
+
+class LayerGrid:
+    """One layer of a compiled level: a row-major grid of TileType values"""
+    def __init__(self, width, height, cells):
+        self.width = width
+        self.height = height
+        self.cells = cells  # Read-only view into the level file
+
+    def tiles(self):
+        """Yield (col, row, tile_type) for every non-empty cell"""
+        cells = self.cells
+        width = self.width
+        for match in NON_EMPTY_CELL.finditer(cells):
+            index = match.start()
+            row, col = divmod(index, width)
+            yield col, row, TILE_TYPES_BY_VALUE[cells[index]]
+
+    def find(self, tile_types):
+        """Yield (col, row, tile_type) for the cells holding one of the given types"""
+        values = bytes(sorted(tile_type.value for tile_type in tile_types))
+        pattern = re.compile(b'[' + re.escape(values) + b']')
+        cells = self.cells
+        for match in pattern.finditer(cells):
+            index = match.start()
+            row, col = divmod(index, self.width)
+            yield col, row, TILE_TYPES_BY_VALUE[cells[index]]
+
+    def tiles_in(self, first_col, first_row, last_col, last_row):
+        """Yield (col, row, tile_type) for the non-empty cells in a block, end exclusive"""
+        first_col, first_row = max(first_col, 0), max(first_row, 0)
+        last_col, last_row = min(last_col, self.width), min(last_row, self.height)
+        for row in range(first_row, last_row):
+            offset = row * self.width
+            cells = self.cells[offset + first_col:offset + last_col]
+            for match in NON_EMPTY_CELL.finditer(cells):
+                index = match.start()
+                yield first_col + index, row, TILE_TYPES_BY_VALUE[cells[index]]
+
+    def is_empty(self):
+        """Check whether the layer has no tiles at all"""
+        return NON_EMPTY_CELL.search(self.cells) is None
+
+class CompiledLevel:
+    """
+    A compiled level file, usually memory-mapped.
+    Use it as a context manager so the mapping is released after loading.
+    """
+    def __init__(self, buffer, mapped=None):
+        self.mapped = mapped
+        self.view = memoryview(buffer)
+        magic, version, layer_count, width, height, entity_size = LEVEL_HEADER.unpack_from(self.view)
+        if magic != LEVEL_MAGIC or version != LEVEL_VERSION:
+            raise ValueError(f"not a version {LEVEL_VERSION} compiled level")
+        self.width = width
+        self.height = height
+        offset = LEVEL_HEADER.size
+        layer_size = width * height
+        self.layers = []
+        for _ in range(layer_count):
+            self.layers.append(LayerGrid(width, height, self.view[offset:offset + layer_size]))
+            offset += layer_size
+        self.background, self.main = self.layers
+        self.entities = json.loads(bytes(self.view[offset:offset + entity_size]).decode('utf-8'))
+
+    @classmethod
+    def open(cls, path):
+        """Memory-map a compiled level file"""
+        with open(path, 'rb') as file:
+            mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        return cls(mapped, mapped)
+
+    def close(self):
+        """Release the views and the memory mapping"""
+        for layer in self.layers:
+            layer.cells.release()
+        self.view.release()
+        if self.mapped is not None:
+            self.mapped.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,108 @@
+"""
+Background preloading of the next level.
+
+While a level is played, a worker thread compiles (or finds in the cache)
+the next level's file, decodes its background images and tests which are
+fully opaque. Converting the images to the display format has to happen on
+the main thread, so update() converts a few of them per frame once the
+worker is done. When
+the player reaches the next level, take() hands over the prepared level
+and the switch only has to create the sprites.
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+import pygame
+from settings import *
+import asset_cache
+from level_compiler import load_compiled_level
+
+class PreparedLevel:
+    """The parts of a level that can be loaded off the main thread"""
+    def __init__(self, compiled, images):
+        self.compiled = compiled  # Open CompiledLevel
+        self.images = images  # Image path -> (decoded, not yet converted Surface, opaque)
+
+def prepare_level(level_data, image_paths):
+    """Worker thread job: compile the level, decode its images and test their opacity"""
+    images = {}
+    for path in image_paths:
+        if os.path.exists(path):
+            image = pygame.image.load(path)
+            images[path] = (image, asset_cache.is_opaque(image))
+    return PreparedLevel(load_compiled_level(level_data), images)
+
+def add_prepared_image(path, image, opaque):
+    """Convert a decoded image into the asset cache, dropping alpha from opaque ones"""
+    if asset_cache.has_image(path):
+        return  # Loaded on the main thread while the worker was busy
+    asset_cache.add_image(path, image.convert() if opaque else image.convert_alpha(), opaque)
+
+def close_prepared(future):
+    """Release a prepared level that will not be used"""
+    if not future.cancelled() and future.exception() is None:
+        future.result().compiled.close()
+
+class LevelPreloader:
+    """Prepares one upcoming level at a time on a worker thread"""
+    def __init__(self):
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='level-preload')
+        self.future = None
+        self.level_data = None
+
+    def preload(self, level_data, image_paths=()):
+        """Start preparing a level, replacing any other preloaded level"""
+        if self.future is not None and self.level_data is level_data:
+            return
+        self.discard()
+        self.level_data = level_data
+        # Images shared with levels already played are in the asset cache
+        image_paths = [path for path in image_paths if not asset_cache.has_image(path)]
+        self.future = self.executor.submit(prepare_level, level_data, image_paths)
+
+    def update(self, budget=PRELOAD_CONVERSIONS_PER_FRAME):
+        """Convert up to budget decoded images into the asset cache, once the worker is done"""
+        if self.future is None or not self.future.done() or self.future.exception() is not None:
+            return
+        images = self.future.result().images
+        while images and budget > 0:
+            path, (image, opaque) = images.popitem()
+            add_prepared_image(path, image, opaque)
+            budget -= 1
+
+    def take(self, level_data):
+        """
+        Get the compiled level prepared for level_data, waiting for the
+        worker if it is not done yet. Returns None if a different level was
+        preloaded or preparing it failed, so the caller loads it directly.
+        """
+        if self.future is None or self.level_data is not level_data:
+            return None
+        future = self.future
+        self.future = None
+        self.level_data = None
+        try:
+            prepared = future.result()
+        except Exception as error:
+            print(f"Warning: preloading {level_data.get('name')} failed: {error}")
+            return None
+        self.convert_all(prepared)
+        return prepared.compiled
+
+    def convert_all(self, prepared):
+        """Convert every image still waiting in a prepared level"""
+        while prepared.images:
+            path, (image, opaque) = prepared.images.popitem()
+            add_prepared_image(path, image, opaque)
+
+    def discard(self):
+        """Drop the preloaded level, releasing it once the worker is done"""
+        if self.future is not None:
+            self.future.add_done_callback(close_prepared)
+        self.future = None
+        self.level_data = None
+
+    def shutdown(self):
+        """Stop the worker thread"""
+        self.discard()
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,123 @@
+"""
+Chunked streaming of large levels.
+
+Instead of creating every tile when a level loads, a LevelStreamer keeps
+the compiled level memory-mapped and creates the tiles, pre-rendered chunk
+and enemies of each RENDER_CHUNK_SIZE chunk only once the camera comes
+within STREAM_RADIUS chunks of it. Loaded chunks are kept in least
+recently used order and evicted beyond STREAM_CHUNK_BUDGET, so memory
+stays bounded however wide the level is.
+
+The collision layer is still loaded whole. At one byte per cell it stays
+small, and enemies far from the camera keep colliding correctly.
+"""
+
+from collections import OrderedDict
+from settings import *
+from tile_types import TileType
+
+# Tiles created once for the whole level and never evicted, because
+# portals are linked to their partner when they are created
+PINNED_TILE_TYPES = {TileType.PORTAL_SET_1, TileType.PORTAL_SET_2}
+
+def should_stream(level, level_data):
+    """Stream a level when it asks to, or by default when it is at least STREAM_MIN_WIDTH tiles wide"""
+    return level_data.get('streaming', level.width >= STREAM_MIN_WIDTH)
+
+class LevelStreamer:
+    """Creates and evicts the tiles of a compiled level chunk by chunk around the camera"""
+    def __init__(self, tilemap, level, spawn_entity=None):
+        self.tilemap = tilemap
+        self.level = level  # Open CompiledLevel, kept mapped while streaming
+        self.spawn_entity = spawn_entity  # Called once per enemy when its chunk first loads
+        self.chunk_tiles = RENDER_CHUNK_SIZE
+        self.chunk_size = RENDER_CHUNK_SIZE * TILE_SIZE
+        self.chunk_cols = -(-level.width // self.chunk_tiles)
+        self.chunk_rows = -(-level.height // self.chunk_tiles)
+        self.loaded = OrderedDict()  # chunk key -> tiles, least recently used first
+        self.cells = {}  # tile -> (layer index, col, row) of the tiles in loaded chunks
+        self.removed = set()  # Cells whose tile was removed during play, e.g. collected pickups
+        self.spawned = set()  # Chunks whose entities have been spawned
+        self.evicting = False
+
+        # Enemies wait in the chunk they start in
+        self.entities = {}
+        for entity in level.entities:
+            if entity['type'] == 'enemy':
+                col, row = entity['position']
+                key = (col // self.chunk_tiles, row // self.chunk_tiles)
+                self.entities.setdefault(key, []).append(entity)
+
+        for layer in level.layers:
+            for col, row, tile_type in layer.find(PINNED_TILE_TYPES):
+                self.tilemap.create_tile(tile_type, (col * TILE_SIZE, row * TILE_SIZE))
+
+    def chunks_around(self, rect):
+        """Get the keys of the level chunks within STREAM_RADIUS chunks of a world rect"""
+        margin = STREAM_RADIUS * self.chunk_size
+        area = rect.inflate(margin * 2, margin * 2)
+        first_x = max(area.left // self.chunk_size, 0)
+        first_y = max(area.top // self.chunk_size, 0)
+        last_x = min((area.right - 1) // self.chunk_size, self.chunk_cols - 1)
+        last_y = min((area.bottom - 1) // self.chunk_size, self.chunk_rows - 1)
+        return [(chunk_x, chunk_y) for chunk_y in range(first_y, last_y + 1) for chunk_x in range(first_x, last_x + 1)]
+
+    def update(self, view_rect):
+        """Load the chunks around view_rect and evict the least recently used ones over budget"""
+        needed = self.chunks_around(view_rect)
+        for key in needed:
+            if key in self.loaded:
+                self.loaded.move_to_end(key)
+            else:
+                self.load_chunk(key)
+        # Chunks still needed were just moved to the end, so eviction stops before them
+        budget = max(STREAM_CHUNK_BUDGET, len(needed))
+        while len(self.loaded) > budget:
+            self.evict_chunk(next(iter(self.loaded)))
+
+    def load_chunk(self, key):
+        """Create the tiles, render chunk and first-time entities of a chunk"""
+        first_col = key[0] * self.chunk_tiles
+        first_row = key[1] * self.chunk_tiles
+        last_col = first_col + self.chunk_tiles
+        last_row = first_row + self.chunk_tiles
+        tiles = []
+        for layer_index, layer in enumerate(self.level.layers):
+            for col, row, tile_type in layer.tiles_in(first_col, first_row, last_col, last_row):
+                cell = (layer_index, col, row)
+                if tile_type in PINNED_TILE_TYPES or cell in self.removed:
+                    continue
+                tile = self.tilemap.create_tile(tile_type, (col * TILE_SIZE, row * TILE_SIZE))
+                self.cells[tile] = cell
+                tiles.append(tile)
+        self.loaded[key] = tiles
+        self.tilemap.render_cache.add_chunk(key, tiles)
+
+        if key not in self.spawned:
+            self.spawned.add(key)
+            if self.spawn_entity:
+                for entity in self.entities.get(key, ()):
+                    self.spawn_entity(entity)
+
+    def evict_chunk(self, key):
+        """Drop the tiles and render chunk of a loaded chunk"""
+        tiles = self.loaded.pop(key)
+        self.evicting = True
+        for tile in tiles:
+            self.tilemap.remove_from_grids(tile)
+            self.cells.pop(tile, None)
+            tile.kill()
+        self.evicting = False
+        self.tilemap.render_cache.drop_chunk(key)
+
+    def forget(self, tile):
+        """Remember that a tile was removed during play so it is not created again"""
+        cell = self.cells.pop(tile, None)
+        if cell is not None:
+            self.removed.add(cell)
+
+    def close(self):
+        """Release the compiled level"""
+        self.loaded.clear()
+        self.cells.clear()
+        self.level.close()
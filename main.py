@@ -7,9 +7,18 @@ from camera import Camera
 from tile_types import TILE_PROPERTIES
 from level_data import LEVEL_1, LEVEL_2, parse_level_data
 from enemy import Enemy, EnemyType
-from music_manager import MusicManager
+import enemy_system
+import asset_cache
+from music_manager import MusicManager, MENU_TRACK, GAME_TRACK, DEATH_TRACK, VICTORY_TRACK
 from parallax_background import ParallaxBackground
 from background_config import LEVEL_BACKGROUNDS
+from input_state import InputState
+from level_preloader import LevelPreloader
+from ui import get_font, get_overlay, render_text, HudText
+from frame_scheduler import FrameScheduler, lerp_position
+from profiler import profiler
+from spike_capture import spike_detector
+import argparse
 import os
 
 class Button:
@@ -17,20 +26,26 @@ class Button:
         self.rect = pygame.Rect(x, y, width, height)
         self.text = text
         self.is_hovered = False
-        self.font = pygame.font.Font(None, 36)
+        self.dirty = True  # Needs drawing since it was last drawn
+        self.font = get_font(36)
         
     def draw(self, screen):
+        """Draw the button, covering its whole rect"""
+        self.dirty = False
         color = BUTTON_HOVER if self.is_hovered else BUTTON_NORMAL
         pygame.draw.rect(screen, color, self.rect)
         pygame.draw.rect(screen, WHITE, self.rect, 2)
         
-        text_surface = self.font.render(self.text, True, WHITE)
+        text_surface = render_text(self.text, 36, WHITE)
         text_rect = text_surface.get_rect(center=self.rect.center)
         screen.blit(text_surface, text_rect)
         
     def handle_event(self, event):
         if event.type == pygame.MOUSEMOTION:
-            self.is_hovered = self.rect.collidepoint(event.pos)
+            is_hovered = self.rect.collidepoint(event.pos)
+            if is_hovered != self.is_hovered:
+                self.is_hovered = is_hovered
+                self.dirty = True
             
         if event.type == pygame.MOUSEBUTTONDOWN:
             if self.is_hovered:
@@ -40,26 +55,32 @@ class Button:
 class Game:
     def __init__(self):
         pygame.init()
-        self.screen = pygame.display.set_mode((WINDOW_WIDTH, WINDOW_HEIGHT))
+        if VSYNC:
+            self.screen = pygame.display.set_mode((WINDOW_WIDTH, WINDOW_HEIGHT), pygame.SCALED, vsync=1)
+        else:
+            self.screen = pygame.display.set_mode((WINDOW_WIDTH, WINDOW_HEIGHT))
         pygame.display.set_caption("Platformer Template")
         self.clock = pygame.time.Clock()
+        # Fixed simulation steps and capped rendering for every state
+        self.scheduler = FrameScheduler(self.clock)
+        self.previous_positions = {}  # Sprite -> position before the last simulation step
+        
+        # Serve tile, player and enemy images from a texture atlas
+        asset_cache.load_atlas()
         
-        self.font = pygame.font.Font(None, 36)
+        self.font = get_font(36)
         self.game_over = False
         self.game_state = "title"  # Can be "title" or "game"
         self.game_complete = False
         
         # Music setup
         self.music_manager = MusicManager()
-        # Set default music paths - you can change these using set_menu_music and set_game_music
-        default_menu_music = os.path.join('assets', 'music', 'menu_music.mp3')
-        default_game_music = os.path.join('assets', 'music', 'game_music.mp3')
-        default_death_music = os.path.join('assets', 'music', 'death_music.mp3')
-        default_victory_music = os.path.join('assets', 'music', 'victory_music.mp3')
-        self.music_manager.set_menu_music(default_menu_music)
-        self.music_manager.set_game_music(default_game_music)
-        self.music_manager.set_death_music(default_death_music)
-        self.music_manager.set_victory_music(default_victory_music)
+        # Set default music paths - you can change these using set_track.
+        # Each track names the one that usually follows it, to decode ahead of time.
+        self.music_manager.set_track(MENU_TRACK, os.path.join('assets', 'music', 'menu_music.mp3'), GAME_TRACK)
+        self.music_manager.set_track(GAME_TRACK, os.path.join('assets', 'music', 'game_music.mp3'), DEATH_TRACK)
+        self.music_manager.set_track(DEATH_TRACK, os.path.join('assets', 'music', 'death_music.mp3'), GAME_TRACK)
+        self.music_manager.set_track(VICTORY_TRACK, os.path.join('assets', 'music', 'victory_music.mp3'), MENU_TRACK)
         
         # Title screen setup
         title_bg_path = os.path.join('assets', 'menu', 'title_bg.png')
@@ -101,6 +122,22 @@ class Game:
         # Initialize background before setup_game
         self.background = ParallaxBackground()
         
+        # Prepares the next level in the background while one is played
+        self.preloader = LevelPreloader()
+        
+        # Keyboard state, sampled once per game tick and shared by all consumers
+        self.input_state = InputState()
+        self.record_path = None
+        
+        # HUD lines, re-rendered only when their value changes
+        self.hud_lives = HudText((10, 10), 'Lives: {}')
+        self.hud_health = HudText((10, 50), 'Health: {}')
+        self.hud_coins = HudText((10, 90), 'Coins: {}')
+        
+        # Menu or end screen currently on the display, for dirty-rect updates
+        self.static_screen = None
+        self.show_profiler = False
+        
         # Game setup
         self.setup_game()
         
@@ -110,38 +147,41 @@ class Game:
         self.collision_sprites = pygame.sprite.Group()
         self.enemy_sprites = pygame.sprite.Group()  # New group for enemies
         
-        # Setup
+        # Setup, releasing the previous game's level first
+        if hasattr(self, 'tilemap'):
+            self.tilemap.close()
         self.tilemap = TileMap(self)
+        self.enemy_system = enemy_system.EnemySystem(self.tilemap.collision_layer)
         self.setup_level()
         
         # Calculate level dimensions
-        level_width = len(LEVEL_1['main_layer'][0]) * TILE_SIZE
-        level_height = len(LEVEL_1['main_layer']) * TILE_SIZE
+        level_width = len(self.current_level['main_layer'][0]) * TILE_SIZE
+        level_height = len(self.current_level['main_layer']) * TILE_SIZE
         
         # Create camera with level dimensions
         self.camera = Camera(level_width, level_height)
 
-    def setup_level(self):
+    def setup_level(self, compiled=None):
         """
-        Load the current level
+        Load the current level, from its preloaded compiled form if given
         """
         # Load tileset
         self.tilemap.load_tileset(TILE_SET_PATH)
         
+        # Remove the previous level's enemies and player before creating the new ones
+        self.enemy_system.clear()
+        if hasattr(self, 'player'):
+            self.player.kill()
+        
         # Create the level using the current level data
-        self.tilemap.load_map(self.current_level)
-        
-        # Create enemies from level data
-        for entity in self.current_level['entities']:
-            if entity['type'] == 'enemy':
-                pos = (entity['position'][0] * TILE_SIZE, entity['position'][1] * TILE_SIZE)
-                enemy_type = EnemyType(entity.get('enemy_type', 'walker'))  # Default to walker if not specified
-                Enemy(
-                    pos=pos,
-                    enemy_type=enemy_type,
-                    groups=[self.all_sprites, self.enemy_sprites],
-                    collision_sprites=self.tilemap.solid_tiles
-                )
+        self.previous_positions = {}
+        self.tilemap.load_map(self.current_level, compiled)
+        
+        # Create enemies from level data, unless the streamed level spawns them chunk by chunk
+        if self.tilemap.streamer is None:
+            for entity in self.current_level['entities']:
+                if entity['type'] == 'enemy':
+                    self.spawn_enemy(entity)
         
         # Create player instance
         player_spawn = self.tilemap.get_player_spawn()
@@ -156,13 +196,37 @@ class Game:
             checkpoint_tiles=self.tilemap.checkpoint_tiles,
             pickup_sprites=self.tilemap.pickup_tiles,
             next_level_tiles=self.tilemap.next_level_tiles,
-            finish_tiles=self.tilemap.finish_tiles  # Add finish tiles
+            finish_tiles=self.tilemap.finish_tiles,  # Add finish tiles
+            collision_layer=self.tilemap.collision_layer,
+            input_state=self.input_state
         )
         
-        # Load level-specific backgrounds
-        if self.current_level['name'] in LEVEL_BACKGROUNDS:
-            for image_path, scroll_speed in LEVEL_BACKGROUNDS[self.current_level['name']]:
-                self.background.add_layer(image_path, scroll_speed)
+        # Switch to the level-specific backgrounds
+        level_name = self.current_level['name']
+        self.background.set_level(level_name, LEVEL_BACKGROUNDS.get(level_name, []))
+        
+        self.preload_next_level()
+
+    def preload_next_level(self):
+        """Start preparing the level after the current one on the preloader's worker thread"""
+        next_index = self.current_level_index + 1
+        if next_index < len(self.levels):
+            level_data = self.levels[next_index]
+            image_paths = [image_path for image_path, _ in LEVEL_BACKGROUNDS.get(level_data['name'], [])]
+            self.preloader.preload(level_data, image_paths)
+
+    def spawn_enemy(self, entity):
+        """Create an enemy from a level entity, simulated by the enemy system (in batches when NumPy is available)"""
+        pos = (entity['position'][0] * TILE_SIZE, entity['position'][1] * TILE_SIZE)
+        enemy_type = EnemyType(entity.get('enemy_type', 'walker'))  # Default to walker if not specified
+        enemy = Enemy(
+            pos=pos,
+            enemy_type=enemy_type,
+            groups=[self.all_sprites, self.enemy_sprites],
+            collision_sprites=self.tilemap.solid_tiles,
+            collision_layer=self.tilemap.collision_layer
+        )
+        self.enemy_system.add(enemy)
 
     def load_next_level(self):
         """
@@ -171,7 +235,9 @@ class Game:
         self.current_level_index += 1
         if self.current_level_index < len(self.levels):
             self.current_level = self.levels[self.current_level_index]
-            self.setup_level()
+            self.setup_level(self.preloader.take(self.current_level))
+            # Don't catch up on the time spent loading
+            self.scheduler.reset()
         else:
             # No more levels, game complete
             self.game_complete = True
@@ -194,37 +260,53 @@ class Game:
         self.all_sprites.empty()
         
         # Start game music
-        self.music_manager.stop_music()
-        self.music_manager.play_game_music()
+        self.music_manager.play(GAME_TRACK)
         
         # Recreate the game setup
         self.setup_game()
 
+    def record_input(self, path):
+        """Record every input tick and save it to path when the game quits"""
+        self.record_path = path
+        self.input_state.start_recording()
+
+    def quit(self):
+        """Save any input recording and exit"""
+        if self.record_path:
+            self.input_state.save_recording(self.record_path)
+        profiler.export()
+        self.preloader.shutdown()
+        self.music_manager.shutdown()
+        pygame.quit()
+        sys.exit()
+
     def run(self):
         """Main game loop"""
         # Start menu music when game launches
-        self.music_manager.play_menu_music()
+        self.music_manager.play(MENU_TRACK)
         
         while True:
+            spike_detector.begin_frame()
             for event in pygame.event.get():
                 if event.type == pygame.QUIT:
-                    pygame.quit()
-                    sys.exit()
+                    self.quit()
+                if event.type in (pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED):
+                    self.static_screen = None  # Window contents were lost, draw everything again
+                if event.type == pygame.KEYDOWN and event.key == pygame.K_F3:
+                    self.toggle_profiler()
                 
                 if self.game_state == "title":
                     if self.start_button.handle_event(event):
                         self.reset_game()  # This will now handle music transition
                     if self.quit_button.handle_event(event):
-                        pygame.quit()
-                        sys.exit()
+                        self.quit()
                 
                 elif self.game_state == "game":
                     if event.type == pygame.KEYDOWN:
                         if event.key == pygame.K_ESCAPE:
                             self.game_state = "title"
                         if event.type == pygame.QUIT:
-                            pygame.quit()
-                            sys.exit()
+                            self.quit()
                         if event.type == pygame.KEYDOWN and self.game_over:
                             if event.key == pygame.K_r:
                                 self.reset_game()
@@ -234,110 +316,213 @@ class Game:
                         self.game_complete = True
                         self.game_state = "game_complete"
                         # Play victory music when reaching finish line
-                        self.music_manager.stop_music()
-                        self.music_manager.play_victory_music()
+                        self.music_manager.play(VICTORY_TRACK)
                 
                 elif self.game_state == "game_complete":
                     # Handle game complete screen events
                     if self.game_complete_button_restart.handle_event(event):
                         # Switch back to menu music when returning to menu
-                        self.music_manager.stop_music()
-                        self.music_manager.play_menu_music()
+                        self.music_manager.play(MENU_TRACK)
                         self.game_state = "title"
                     if self.game_complete_button_quit.handle_event(event):
-                        pygame.quit()
-                        sys.exit()
+                        self.quit()
             
-            self.screen.fill(BLACK)
+            profiler.lap('events')
             
-            if self.game_state == "title":
-                self.screen.blit(self.title_bg, (0, 0))
-                self.start_button.draw(self.screen)
-                self.quit_button.draw(self.screen)
-            
-            elif self.game_state == "game":
-                # Delta time
-                dt = self.clock.tick(FPS) / 1000
-                
-                if not self.game_over:
-                
-                    # Update
-                    self.all_sprites.update(dt)
-                    self.camera.update(self.player)
-                
-                    # Check for level progression
-                    if self.player.check_next_level_collision():
-                        self.load_next_level()
-                
-                    # Check for hazard collisions
-                    hazard_hits = pygame.sprite.spritecollide(self.player, self.tilemap.hazard_tiles, False)
-                    for hazard in hazard_hits:
-                        tile_type = hazard.tile_type
-                        damage = TILE_PROPERTIES[tile_type]['damage']
-                        if self.player.take_damage(damage):  # Player died
-                            if self.player.lives <= 0:
-                                self.game_over = True
-                    
-                    # Check for enemy collisions
-                    enemy_hits = pygame.sprite.spritecollide(self.player, self.enemy_sprites, False)
-                    for enemy in enemy_hits:
-                        if self.player.take_damage(enemy.damage):  # Player died
-                            if self.player.lives <= 0:
-                                self.game_over = True
-                
-                    # Draw parallax background
-                    self.background.draw(self.screen, self.camera.x)
-                    
-                    # Draw all sprites with camera offset
-                    for sprite in self.tilemap.all_sprites:
-                        self.screen.blit(sprite.image, self.camera.apply(sprite))
-                    for sprite in self.all_sprites:
-                        self.screen.blit(sprite.image, self.camera.apply(sprite))
-                        
-                    self.draw_hud()
-                else:
-                    self.draw_game_over()        
+            # Menus and end screens run at the idle rate. Sleeping for the
+            # frame cap is not work, so it doesn't count towards a spike.
+            spike_detector.pause()
+            steps = self.scheduler.begin_frame(self.is_simulating())
+            spike_detector.resume()
+            profiler.lap('wait')
+            for _ in range(steps):
+                if not self.is_simulating():
+                    break
+                if RENDER_INTERPOLATION:
+                    self.save_previous_state()
+                self.update(self.scheduler.step)
             
-            elif self.game_state == "game_complete":
-                # Draw game complete screen
-                self.draw_game_complete_screen()
+            # Start any requested music that has finished decoding
+            self.music_manager.update()
+            profiler.lap('music')
             
+            if self.is_simulating():
+                self.screen.fill(BLACK)
+                self.draw_game(self.scheduler.alpha if RENDER_INTERPOLATION else 1.0)
+                if self.show_profiler:
+                    profiler.draw_overlay(self.screen)
+                    profiler.lap('overlay')
+                pygame.display.flip()
+                self.static_screen = None
+            elif DIRTY_RECT_UPDATES:
+                self.present_static_screen()
+            else:
+                self.draw_static_screen()
+                pygame.display.flip()
+            profiler.lap('flip')
+            profiler.end_frame()
+            spike_detector.end_frame(self.spike_context)
+
+    def spike_context(self):
+        """Describe the game for a frame spike dump"""
+        return {
+            'game_state': self.game_state,
+            'game_over': self.game_over,
+            'level': self.current_level.get('name'),
+            'player_position': self.player.rect.topleft,
+            'tick': self.input_state.tick,
+            'enemies': len(self.enemy_sprites),
+        }
+
+    def toggle_profiler(self):
+        """Show or hide the frame timing overlay, timing frames while it is shown"""
+        self.show_profiler = not self.show_profiler
+        profiler.set_enabled(self.show_profiler or PROFILE_ENABLED or bool(profiler.export_path))
+
+    def is_simulating(self):
+        """Check whether the game world is running, rather than a menu or end screen"""
+        return self.game_state == "game" and not self.game_over
+
+    def save_previous_state(self):
+        """Remember sprite and camera positions before a simulation step, for interpolation"""
+        self.previous_positions = {sprite: sprite.rect.topleft for sprite in self.all_sprites}
+        self.camera.save_previous()
+
+    def static_screen_name(self):
+        """Name of the menu or end screen for the current state"""
+        return "game_over" if self.game_state == "game" else self.game_state
+
+    def static_screen_buttons(self):
+        """Buttons shown on the current menu or end screen"""
+        if self.game_state == "title":
+            return [self.start_button, self.quit_button]
+        if self.game_state == "game_complete":
+            return [self.game_complete_button_restart, self.game_complete_button_quit]
+        return []
+
+    def draw_static_screen(self):
+        """Draw the whole menu or end screen for the current state"""
+        self.screen.fill(BLACK)
+        if self.game_state == "title":
+            self.screen.blit(self.title_bg, (0, 0))
+            self.start_button.draw(self.screen)
+            self.quit_button.draw(self.screen)
+        elif self.game_state == "game":
+            self.draw_game_over()
+        elif self.game_state == "game_complete":
+            # Draw game complete screen
+            self.draw_game_complete_screen()
+
+    def present_static_screen(self):
+        """
+        Show the menu or end screen. The whole screen is drawn and flipped
+        when it first appears; after that only buttons that changed are
+        redrawn and pushed with display.update.
+        """
+        name = self.static_screen_name()
+        if name != self.static_screen:
+            self.static_screen = name
+            self.draw_static_screen()
             pygame.display.flip()
+            return
+        dirty_rects = []
+        for button in self.static_screen_buttons():
+            if button.dirty:
+                button.draw(self.screen)
+                dirty_rects.append(button.rect)
+        if dirty_rects:
+            pygame.display.update(dirty_rects)
 
-    def draw_hud(self):
-        # Draw lives
-        lives_text = self.font.render(f'Lives: {self.player.lives}', True, (255, 255, 255))
-        self.screen.blit(lives_text, (10, 10))
+    def update(self, dt):
+        """Advance the game simulation by one step of dt seconds"""
+        self.input_state.sample()
+        self.preloader.update()
+        profiler.lap('input')
+        # Only enemies near the camera are simulated at full rate
+        self.enemy_system.update(dt, self.camera.activation_regions(), self.input_state.tick)
+        profiler.lap('enemy_batches')
+        self.all_sprites.update(dt)
+        profiler.lap('sprites')
+        self.camera.update(self.player)
+        profiler.lap('camera')
+        self.tilemap.update(dt, self.camera.view_rect)
+        profiler.lap('tile_animation')
+        
+        # Check for level progression
+        if self.player.check_next_level_collision():
+            self.load_next_level()
+        profiler.lap('level_progress')
         
-        # Draw health
-        health_text = self.font.render(f'Health: {self.player.health}', True, (255, 255, 255))
-        self.screen.blit(health_text, (10, 50))
+        self.check_hazard_collisions()
+        profiler.lap('hazards')
+        self.check_enemy_collisions()
+        profiler.lap('enemies')
+
+    def check_hazard_collisions(self):
+        """Damage the player for every hazard tile it touches"""
+        hazard_hits = pygame.sprite.spritecollide(self.player, self.tilemap.hazard_tiles, False)
+        for hazard in hazard_hits:
+            tile_type = hazard.tile_type
+            damage = TILE_PROPERTIES[tile_type]['damage']
+            if self.player.take_damage(damage):  # Player died
+                if self.player.lives <= 0:
+                    self.game_over = True
 
-        # Draw coins
-        coins_text = self.font.render(f'Coins: {self.player.coins}', True, (255, 255, 255))
-        self.screen.blit(coins_text, (10, 90))
+    def check_enemy_collisions(self):
+        """Damage the player for every enemy it touches"""
+        enemy_hits = pygame.sprite.spritecollide(self.player, self.enemy_sprites, False)
+        for enemy in enemy_hits:
+            if self.player.take_damage(enemy.damage):  # Player died
+                if self.player.lives <= 0:
+                    self.game_over = True
+
+    def draw_game(self, alpha=1.0):
+        """
+        Draw the level, sprites and HUD for the current frame, alpha of the
+        way from the previous simulation step to the current one
+        """
+        camera = self.camera if alpha >= 1.0 else self.camera.interpolated(alpha)
+        
+        # Draw parallax background
+        self.background.draw(self.screen, camera.x)
+        profiler.lap('parallax')
+        
+        # Draw visible tiles and sprites with camera offset
+        self.tilemap.draw(self.screen, camera)
+        profiler.lap('tiles')
+        view_rect = camera.view_rect
+        offset_x, offset_y = camera.camera.topleft
+        previous_positions = self.previous_positions if alpha < 1.0 else {}
+        for sprite in self.all_sprites:
+            if view_rect.colliderect(sprite.rect):
+                x, y = lerp_position(previous_positions.get(sprite), sprite.rect.topleft, alpha)
+                self.screen.blit(sprite.image, (x + offset_x, y + offset_y))
+        profiler.lap('sprite_draw')
+            
+        self.draw_hud()
+        profiler.lap('hud')
+
+    def draw_hud(self):
+        # Draw lives, health and coins
+        self.hud_lives.draw(self.screen, self.player.lives)
+        self.hud_health.draw(self.screen, self.player.health)
+        self.hud_coins.draw(self.screen, self.player.coins)
     
     def draw_game_over(self):
-        # Stop current music and play death music
-        if not hasattr(self, 'current_music') or self.current_music != "death":
-            self.music_manager.stop_music()
-            self.music_manager.play_death_music()
-            self.current_music = "death"
-            
-        game_over_text = self.font.render('Game Over! Press R to restart', True, (255, 255, 255))
+        # Switch to death music (does nothing if it is already playing)
+        self.music_manager.play(DEATH_TRACK)
+        
+        game_over_text = render_text('Game Over! Press R to restart', 36, WHITE)
         text_rect = game_over_text.get_rect(center=(WINDOW_WIDTH/2, WINDOW_HEIGHT/2))
         self.screen.blit(game_over_text, text_rect)
     
     def draw_game_complete_screen(self):
         """Draw game completion screen"""
         # Semi-transparent overlay
-        overlay = pygame.Surface((WINDOW_WIDTH, WINDOW_HEIGHT), pygame.SRCALPHA)
-        overlay.fill((0, 0, 0, 128))  # Black with 50% transparency
-        self.screen.blit(overlay, (0, 0))
+        self.screen.blit(get_overlay((0, 0, 0, 128)), (0, 0))  # Black with 50% transparency
         
         # Game complete text
-        font_large = pygame.font.Font(None, 72)
-        game_complete_text = font_large.render("Congratulations!", True, WHITE)
+        game_complete_text = render_text("Congratulations!", 72, WHITE)
         text_rect = game_complete_text.get_rect(center=(WINDOW_WIDTH // 2, WINDOW_HEIGHT // 2 - 100))
         self.screen.blit(game_complete_text, text_rect)
         
@@ -346,5 +531,23 @@ class Game:
         self.game_complete_button_quit.draw(self.screen)
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Platformer Template")
+    parser.add_argument('--record', metavar='PATH', help="record keyboard input to a file")
+    parser.add_argument('--replay', metavar='PATH', help="replay keyboard input from a recording")
+    parser.add_argument('--spikes', metavar='DIR', nargs='?', const=SPIKE_DUMP_DIR,
+                        help=f"profile every frame and dump those over {SPIKE_BUDGET_MS} ms to DIR")
+    parser.add_argument('--profile', metavar='PATH', help="time each subsystem and write the stats to a .csv or .json file on exit")
+    args = parser.parse_args()
+    
     game = Game()
+    if args.record:
+        game.record_input(args.record)
+    if args.replay:
+        game.input_state.load_replay(args.replay)
+    if args.spikes:
+        spike_detector.output_dir = args.spikes
+        spike_detector.set_enabled(True)
+    if args.profile:
+        profiler.export_path = args.profile
+        profiler.set_enabled(True)
     game.run()
@@ -1,63 +1,106 @@
 import pygame
 import os
+from concurrent.futures import ThreadPoolExecutor
+from settings import *
+
+# Track ids for the music the game switches between
+MENU_TRACK = 'menu'
+GAME_TRACK = 'game'
+DEATH_TRACK = 'death'
+VICTORY_TRACK = 'victory'
 
 class MusicManager:
-    def __init__(self):
-        self.current_music = None
-        self.menu_music_path = None
-        self.game_music_path = None
-        self.death_music_path = None
-        self.victory_music_path = None
-        
-    def set_menu_music(self, path):
-        """Set the path for menu music"""
-        self.menu_music_path = path
-        
-    def set_game_music(self, path):
-        """Set the path for game music"""
-        self.game_music_path = path
-        
-    def set_death_music(self, path):
-        """Set the path for death music"""
-        self.death_music_path = path
-        
-    def set_victory_music(self, path):
-        """Set the path for victory/completion music"""
-        self.victory_music_path = path
-        
-    def play_menu_music(self):
-        """Play menu music if set"""
-        if self.menu_music_path and os.path.exists(self.menu_music_path):
-            if self.current_music != self.menu_music_path:
-                pygame.mixer.music.load(self.menu_music_path)
-                pygame.mixer.music.play(-1)  # -1 means loop indefinitely
-                self.current_music = self.menu_music_path
-                
-    def play_game_music(self):
-        """Play game music if set"""
-        if self.game_music_path and os.path.exists(self.game_music_path):
-            if self.current_music != self.game_music_path:
-                pygame.mixer.music.load(self.game_music_path)
-                pygame.mixer.music.play(-1)  # -1 means loop indefinitely
-                self.current_music = self.game_music_path
-                
-    def play_death_music(self):
-        """Play death music if set"""
-        if self.death_music_path and os.path.exists(self.death_music_path):
-            if self.current_music != self.death_music_path:
-                pygame.mixer.music.load(self.death_music_path)
-                pygame.mixer.music.play(-1)  # -1 means loop indefinitely
-                self.current_music = self.death_music_path
-                
-    def play_victory_music(self):
-        """Play victory music if set"""
-        if self.victory_music_path and os.path.exists(self.victory_music_path):
-            if self.current_music != self.victory_music_path:
-                pygame.mixer.music.load(self.victory_music_path)
-                pygame.mixer.music.play(-1)  # -1 means loop indefinitely
-                self.current_music = self.victory_music_path
-                
+    """
+    Plays one looping music track at a time.
+    Tracks are decoded into Sounds on a worker thread, so switching never
+    loads a file on the main thread. Only the requested track and the one
+    set to follow it are kept decoded, since every decoded track holds
+    its whole length in memory. Switching crossfades between two reserved
+    mixer channels. A track requested before it is decoded starts from
+    update() once it is ready.
+    """
+    def __init__(self, fade_ms=MUSIC_FADE_MS):
+        self.fade_ms = fade_ms
+        self.paths = {}
+        self.next_tracks = {}  # track id -> track id usually played after it
+        self.sounds = {}  # track id -> Future of the decoded Sound
+        self.current_music = None  # Track id requested last
+        self.playing = None  # Track id actually playing
+        self.channels = []
+        self.active_channel = 0
+        self.enabled = pygame.mixer.get_init() is not None
+        if self.enabled:
+            pygame.mixer.set_reserved(2)
+            self.channels = [pygame.mixer.Channel(0), pygame.mixer.Channel(1)]
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='music-decode')
+
+    def set_track(self, track_id, path, next_track=None):
+        """
+        Set the file for a track, and the track usually played after it,
+        which is decoded in the background while this one plays
+        """
+        self.paths[track_id] = path
+        self.next_tracks[track_id] = next_track
+        future = self.sounds.pop(track_id, None)
+        if future is not None:
+            future.cancel()
+        self.prebuffer()
+
+    def prebuffer(self):
+        """Start decoding the requested track and the one after it, and drop every other decoded track"""
+        wanted = {self.current_music, self.next_tracks.get(self.current_music)} - {None}
+        for track_id in list(self.sounds):
+            if track_id not in wanted:
+                # A track still fading out keeps playing; its channel holds the Sound
+                self.sounds.pop(track_id).cancel()
+        for track_id in wanted:
+            path = self.paths.get(track_id)
+            if track_id not in self.sounds and self.enabled and path and os.path.exists(path):
+                self.sounds[track_id] = self.executor.submit(pygame.mixer.Sound, path)
+
+    def play(self, track_id):
+        """Switch to a track, crossfading from the current one. Never blocks on decoding."""
+        if track_id == self.current_music:
+            return
+        self.current_music = track_id
+        self.prebuffer()
+        self.update()
+
+    def update(self):
+        """Start the requested track once it is decoded; call once per frame"""
+        if self.current_music == self.playing:
+            return
+        future = self.sounds.get(self.current_music)
+        if future is None:
+            # Track not set or missing, fade out whatever is playing
+            self.fade_out()
+            return
+        if not future.done():
+            return
+        try:
+            sound = future.result()
+        except pygame.error as error:
+            print(f"Warning: could not load music {self.paths.get(self.current_music)}: {error}")
+            self.sounds.pop(self.current_music, None)
+            return
+        self.fade_out()
+        self.active_channel = 1 - self.active_channel
+        self.channels[self.active_channel].play(sound, loops=-1, fade_ms=self.fade_ms)
+        self.playing = self.current_music
+
+    def fade_out(self):
+        """Fade out the playing track"""
+        if self.playing is not None:
+            self.channels[self.active_channel].fadeout(self.fade_ms)
+            self.playing = None
+
     def stop_music(self):
         """Stop current music"""
-        pygame.mixer.music.stop()
+        for channel in self.channels:
+            channel.stop()
         self.current_music = None
+        self.playing = None
+
+    def shutdown(self):
+        """Stop the decoding thread"""
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -1,21 +1,33 @@
 import pygame
 import os
+from settings import *
+from asset_cache import load_image, add_image, image_opaque
 
 class ParallaxLayer:
     def __init__(self, image_path, scroll_speed):
-        self.image = pygame.image.load(image_path).convert_alpha()
+        image = load_image(image_path)
+        # Fully opaque layers (like skies) drop per-pixel alpha so they blit as a plain copy.
+        # Preloaded levels arrive already tested and converted.
+        self.opaque = image_opaque(image_path)
+        if self.opaque and image.get_flags() & pygame.SRCALPHA:
+            image = image.convert()
+            add_image(image_path, image, True)
+        self.image = image
         self.scroll_speed = scroll_speed
         self.x1 = 0
         self.x2 = self.image.get_width()
-        
+        # An opaque layer at least as big as the window hides every layer behind it
+        self.covers_screen = (self.opaque and self.image.get_width() >= WINDOW_WIDTH
+                              and self.image.get_height() >= WINDOW_HEIGHT)
+
     def update(self, camera_x):
         # Calculate relative position based on camera
         rel_x = (camera_x * self.scroll_speed) % self.image.get_width()
-            
+
     def draw(self, screen, camera_x):
         # Calculate relative position based on camera
         rel_x = (camera_x * self.scroll_speed) % self.image.get_width()
-        
+
         # Draw the background images side by side
         if rel_x < 0:
             screen.blit(self.image, (rel_x + self.image.get_width(), 0))
@@ -27,25 +39,53 @@ class ParallaxLayer:
 class ParallaxBackground:
     def __init__(self):
         self.layers = []
-        
+        self.visible_layers = []  # Layers from the last one that covers the screen
+        self.level_layers = {}  # Level name -> layers, built the first time the level loads
+
+    def create_layer(self, image_path, scroll_speed):
+        """Create a layer, or return None if its image is missing"""
+        if os.path.exists(image_path):
+            return ParallaxLayer(image_path, scroll_speed)
+        print(f"Warning: Background image not found at {image_path}")
+        return None
+
     def add_layer(self, image_path, scroll_speed):
         """
         Add a new parallax layer
         :param image_path: Path to the background image
         :param scroll_speed: Speed at which this layer scrolls (0.0 to 1.0)
         """
-        if os.path.exists(image_path):
-            layer = ParallaxLayer(image_path, scroll_speed)
-            self.layers.append(layer)
-        else:
-            print(f"Warning: Background image not found at {image_path}")
-            
+        layer = self.create_layer(image_path, scroll_speed)
+        if layer:
+            self.set_layers(self.layers + [layer])
+
+    def set_level(self, level_name, layer_specs):
+        """
+        Replace the layers with those of a level, given as (image_path,
+        scroll_speed) pairs. Each level's layers are only built once.
+        """
+        layers = self.level_layers.get(level_name)
+        if layers is None:
+            layers = [self.create_layer(image_path, scroll_speed) for image_path, scroll_speed in layer_specs]
+            layers = [layer for layer in layers if layer]
+            self.level_layers[level_name] = layers
+        self.set_layers(layers)
+
+    def set_layers(self, layers):
+        """Use a list of layers, skipping those hidden behind a screen-covering layer"""
+        self.layers = layers
+        first_visible = 0
+        for index, layer in enumerate(layers):
+            if layer.covers_screen:
+                first_visible = index
+        self.visible_layers = layers[first_visible:]
+
     def update(self, camera_x):
         """Update all parallax layers"""
         for layer in self.layers:
             layer.update(camera_x)
-            
+
     def draw(self, screen, camera_x):
-        """Draw all parallax layers"""
-        for layer in self.layers:
+        """Draw the parallax layers that are not hidden"""
+        for layer in self.visible_layers:
             layer.draw(screen, camera_x)
@@ -1,15 +1,18 @@
 import pygame
 from settings import *
 from animation import Animation
-import logging
+from tile_types import TileType, TILE_PROPERTIES
+from input_state import InputState
+from event_trace import tracer
 
-# Set up logging
-logging.basicConfig(level=logging.INFO, 
-                   format='%(asctime)s - %(message)s',
-                   datefmt='%H:%M:%S')
+# Tile types held by each collision group, used for collision layer queries
+SOLID_TYPES = {TileType.SOLID}
+CONVEYOR_TYPES = {TileType.CONVEYOR_LEFT, TileType.CONVEYOR_RIGHT}
+LADDER_TYPES = {TileType.LADDER}
+PLATFORM_TYPES = {TileType.PLATFORM}
 
 class Player(pygame.sprite.Sprite):
-    def __init__(self, pos, groups, collision_sprites, platform_sprites=None, ladder_sprites=None, conveyor_sprites=None, portal_sprites=None, checkpoint_tiles=None, pickup_sprites=None, next_level_tiles=None, finish_tiles=None):
+    def __init__(self, pos, groups, collision_sprites, platform_sprites=None, ladder_sprites=None, conveyor_sprites=None, portal_sprites=None, checkpoint_tiles=None, pickup_sprites=None, next_level_tiles=None, finish_tiles=None, collision_layer=None, input_state=None):
         super().__init__(groups)
         
         # Player stats
@@ -20,6 +23,8 @@ class Player(pygame.sprite.Sprite):
         self.invulnerable = False
         self.invulnerable_timer = 0
         self.invulnerability_duration = 1000
+        # Simulated time in milliseconds, for timers (see frame_scheduler)
+        self.time_ms = 0
         self.initial_pos = pos
         self.checkpoint_pos = pos  # Store last checkpoint position
         
@@ -50,6 +55,7 @@ class Player(pygame.sprite.Sprite):
         self.pickup_sprites = pickup_sprites or pygame.sprite.Group()
         self.next_level_tiles = next_level_tiles or pygame.sprite.Group()
         self.finish_tiles = finish_tiles or pygame.sprite.Group()
+        self.collision_layer = collision_layer  # Dense tile grid for direct cell lookups
         
         # State flags
         self.on_ladder = False
@@ -57,9 +63,13 @@ class Player(pygame.sprite.Sprite):
         self.on_conveyor = False
         self.is_climbing = False  # New state to track if actually climbing
         self.near_portal = False
+        
+        # Input sampled once per tick; the player samples it itself unless the game does
+        self.owns_input = input_state is None
+        self.input_state = input_state or InputState()
 
     def input(self):
-        keys = pygame.key.get_pressed()
+        keys = self.input_state
         
         # Start climbing only when pressing UP while touching a ladder
         if self.on_ladder and keys[pygame.K_UP]:
@@ -106,46 +116,86 @@ class Player(pygame.sprite.Sprite):
                 portal = portal_collisions[0]
                 if hasattr(portal, 'teleport'):
                     portal.teleport(self)
-                    logging.info("Player teleported through portal")
+                    if tracer.info:
+                        tracer.record('teleport', self.rect.topleft)
+
+    def nearby_tiles(self, sprites, tile_types):
+        """
+        Get (tile_type, hitbox) pairs for the tiles of the given types around
+        the hitbox from the collision layer, falling back to the whole sprite
+        group when no layer was given
+        """
+        if self.collision_layer is None:
+            return [(sprite.tile_type, sprite.hitbox) for sprite in sprites]
+        return self.collision_layer.query(self.hitbox, tile_types)
+
+    def platforms_in_fall(self, original_y, next_y, edge_tolerance):
+        """
+        Get the hitboxes of the one-way platforms the hitbox could land on
+        while falling from original_y to next_y. With a collision layer only
+        the cells under the swept vertical range are looked at.
+        """
+        if self.collision_layer is None:
+            return [sprite.hitbox for sprite in self.platform_sprites]
+        # Platform tops sit a few pixels into their cell, so pad the swept range
+        top = int(original_y) + self.hitbox.height - TILE_SIZE
+        bottom = int(next_y) + self.hitbox.height + 1
+        swept = pygame.Rect(
+            self.hitbox.left - edge_tolerance, top,
+            self.hitbox.width + edge_tolerance * 2, bottom - top
+        )
+        return [hitbox for _, hitbox in self.collision_layer.query(swept, PLATFORM_TYPES)]
+
+    def sweep_move(self, dx, dy, tile_types):
+        """
+        Move the hitbox by (dx, dy) along one axis, stopping flush against
+        the first tile of the given types in the way instead of tunneling
+        through it. Returns the contact normal, or None if nothing was hit.
+        """
+        if self.collision_layer is None:
+            self.hitbox.x += dx
+            self.hitbox.y += dy
+            return None
+        return self.collision_layer.move(self.hitbox, dx, dy, tile_types)
 
     def apply_gravity(self):
         self.direction.y += self.gravity
-        self.hitbox.y += self.direction.y
+        self.sweep_move(0, self.direction.y, SOLID_TYPES)
 
     def horizontal_collisions(self):
         """Handle horizontal collisions with solid tiles and conveyors"""
         # Apply horizontal movement
         movement = self.direction.x * self.speed
-        self.hitbox.x += movement
+        self.sweep_move(movement, 0, SOLID_TYPES)
         
         # Create a combined list of relevant collision objects
         collision_objects = []
         # Add solid tiles first as they take priority
-        collision_objects.extend((sprite, 'solid') for sprite in self.collision_sprites)
+        collision_objects.extend((tile, 'solid') for tile in self.nearby_tiles(self.collision_sprites, SOLID_TYPES))
         # Add conveyor tiles with their properties
-        collision_objects.extend((sprite, 'conveyor') for sprite in self.conveyor_sprites)
+        collision_objects.extend((tile, 'conveyor') for tile in self.nearby_tiles(self.conveyor_sprites, CONVEYOR_TYPES))
         
         self.on_conveyor = False
         
         # Check all collisions in one pass
-        for sprite, obj_type in collision_objects:
-            if sprite.hitbox.colliderect(self.hitbox):
+        for (tile_type, hitbox), obj_type in collision_objects:
+            if hitbox.colliderect(self.hitbox):
                 if obj_type == 'solid':
                     # Handle solid collision
                     if self.direction.x < 0:  # Moving left
-                        self.hitbox.left = sprite.hitbox.right
+                        self.hitbox.left = hitbox.right
                     elif self.direction.x > 0:  # Moving right
-                        self.hitbox.right = sprite.hitbox.left
+                        self.hitbox.right = hitbox.left
                     break  # Exit after first solid collision
                 elif obj_type == 'conveyor' and not self.on_conveyor:
                     # Only apply conveyor if no solid collision occurred
                     self.on_conveyor = True
-                    conveyor_speed = TILE_PROPERTIES[sprite.tile_type].get('speed', 0)
+                    conveyor_speed = TILE_PROPERTIES[tile_type].get('speed', 0)
                     # Check if applying conveyor speed would cause a collision
                     self.hitbox.x += conveyor_speed
                     # Check if this would cause a collision with a solid
-                    for solid in self.collision_sprites:
-                        if solid.hitbox.colliderect(self.hitbox):
+                    for _, solid_hitbox in self.nearby_tiles(self.collision_sprites, SOLID_TYPES):
+                        if solid_hitbox.colliderect(self.hitbox):
                             # Revert conveyor movement if it would cause collision
                             self.hitbox.x -= conveyor_speed
                             break
@@ -157,10 +207,11 @@ class Player(pygame.sprite.Sprite):
         """Handle vertical collisions with solid tiles, platforms, and ladders"""
         # First check ladder collisions as they don't need complex resolution
         self.on_ladder = False
-        for sprite in self.ladder_sprites:
-            if sprite.hitbox.colliderect(self.hitbox):
+        for _, hitbox in self.nearby_tiles(self.ladder_sprites, LADDER_TYPES):
+            if hitbox.colliderect(self.hitbox):
                 self.on_ladder = True
-                logging.info("Player touching ladder")
+                if tracer.debug:
+                    tracer.record('ladder_touch', hitbox.topleft)
                 break
             
         # Apply gravity only if not climbing
@@ -171,80 +222,88 @@ class Player(pygame.sprite.Sprite):
         original_y = self.hitbox.y
         next_y = original_y + self.direction.y
         
-        logging.debug(f"Player Y movement: original_y={original_y:.2f}, next_y={next_y:.2f}, direction.y={self.direction.y:.2f}")
+        if tracer.debug:
+            tracer.record('y_movement', original_y, next_y, self.direction.y)
         
         # First check platforms when moving downward
         self.on_ground = False
         if self.direction.y > 0:  # Only check platforms when falling
-            logging.info(f"Number of platform sprites: {len(self.platform_sprites)}")
-            
             # Calculate player center for more precise platform detection
             player_center_x = self.hitbox.centerx
             
-            # Sort platforms by distance to player center for more accurate collision detection
-            sorted_platforms = sorted(
-                self.platform_sprites,
-                key=lambda sprite: abs(sprite.hitbox.centerx - player_center_x)
-            )
+            # Add horizontal tolerance for platform edges (half of tile size)
+            edge_tolerance = TILE_SIZE // 2
             
-            for sprite in sorted_platforms:
-                logging.debug(f"Checking platform at position {sprite.rect.topleft}")
-                logging.debug(f"Platform hitbox: top={sprite.hitbox.top}, bottom={sprite.hitbox.bottom}")
-                logging.debug(f"Player hitbox: x={self.hitbox.x}, width={self.hitbox.width}")
-                logging.debug(f"Platform hitbox: x={sprite.hitbox.x}, width={sprite.hitbox.width}")
-                
-                # Add horizontal tolerance for platform edges (half of tile size)
-                edge_tolerance = TILE_SIZE // 2
-                
+            landing_hitbox = None
+            for hitbox in self.platforms_in_fall(original_y, next_y, edge_tolerance):
                 # Check if we're horizontally within the platform's bounds (with tolerance)
                 horizontally_aligned = (
-                    self.hitbox.right > sprite.hitbox.left - edge_tolerance and 
-                    self.hitbox.left < sprite.hitbox.right + edge_tolerance
+                    self.hitbox.right > hitbox.left - edge_tolerance and 
+                    self.hitbox.left < hitbox.right + edge_tolerance
                 )
                 
                 # We're falling and were above the platform in the previous frame
-                was_above = original_y + self.hitbox.height <= sprite.hitbox.top + 5
-                will_intersect = next_y + self.hitbox.height > sprite.hitbox.top
-                
-                logging.debug(f"Horizontally aligned with platform: {horizontally_aligned}")
-                logging.debug(f"Was above platform: {was_above}")
-                logging.debug(f"Will intersect platform: {will_intersect}")
+                was_above = original_y + self.hitbox.height <= hitbox.top + 5
+                will_intersect = next_y + self.hitbox.height > hitbox.top
                 
+                # Land on the platform closest to the player center
                 if horizontally_aligned and was_above and will_intersect:
-                    logging.info(f"Landing on platform at y={sprite.hitbox.top}")
-                    self.hitbox.y = sprite.hitbox.top - self.hitbox.height
-                    self.direction.y = 0
-                    self.on_ground = True
-                    break
+                    if landing_hitbox is None or (
+                        abs(hitbox.centerx - player_center_x) < abs(landing_hitbox.centerx - player_center_x)
+                    ):
+                        landing_hitbox = hitbox
+            
+            if landing_hitbox:
+                if tracer.info:
+                    tracer.record('platform_land', landing_hitbox.top)
+                self.hitbox.y = landing_hitbox.top - self.hitbox.height
+                self.direction.y = 0
+                self.on_ground = True
         
         # If we haven't landed on a platform, apply movement and check solid collisions
         if not self.on_ground:
-            self.hitbox.y = next_y
-            logging.debug("Checking solid collisions")
-            for sprite in self.collision_sprites:
-                if sprite.hitbox.colliderect(self.hitbox):
-                    if self.direction.y > 0:  # Moving down
-                        logging.info(f"Landing on solid tile at y={sprite.hitbox.top}")
-                        self.hitbox.bottom = sprite.hitbox.top
-                        self.direction.y = 0
-                        self.on_ground = True
-                    elif self.direction.y < 0:  # Moving up
-                        logging.info(f"Hitting ceiling at y={sprite.hitbox.bottom}")
-                        self.hitbox.top = sprite.hitbox.bottom
-                        self.direction.y = 0
-                    break
+            normal = self.sweep_move(0, next_y - original_y, SOLID_TYPES)
+            if normal is not None:
+                # Stopped flush against a tile on the way
+                if normal[1] < 0:  # Landed on top of it
+                    if tracer.info:
+                        tracer.record('solid_land', self.hitbox.bottom)
+                    self.on_ground = True
+                elif tracer.info:
+                    tracer.record('ceiling_hit', self.hitbox.top)
+                self.direction.y = 0
+            else:
+                self.resolve_solid_overlap()
         
-        # Log final position
-        logging.debug(f"Final position: y={self.hitbox.y:.2f}, on_ground={self.on_ground}, direction.y={self.direction.y:.2f}")
+        # Trace final position
+        if tracer.debug:
+            tracer.record('final_y', self.hitbox.y, self.on_ground, self.direction.y)
         
         # Update rect position
         self.rect.centery = self.hitbox.centery
 
+    def resolve_solid_overlap(self):
+        """Push the hitbox out of a solid tile it ended up overlapping"""
+        for _, hitbox in self.nearby_tiles(self.collision_sprites, SOLID_TYPES):
+            if hitbox.colliderect(self.hitbox):
+                if self.direction.y > 0:  # Moving down
+                    if tracer.info:
+                        tracer.record('solid_land', hitbox.top)
+                    self.hitbox.bottom = hitbox.top
+                    self.direction.y = 0
+                    self.on_ground = True
+                elif self.direction.y < 0:  # Moving up
+                    if tracer.info:
+                        tracer.record('ceiling_hit', hitbox.bottom)
+                    self.hitbox.top = hitbox.bottom
+                    self.direction.y = 0
+                break
+
     def take_damage(self, amount):
         if not self.invulnerable:
             self.health -= amount
             self.invulnerable = True
-            self.invulnerable_timer = pygame.time.get_ticks()
+            self.invulnerable_timer = self.time_ms
             
             if self.health <= 0:
                 self.lives -= 1
@@ -263,8 +322,7 @@ class Player(pygame.sprite.Sprite):
     def check_next_level_collision(self):
         next_level_hits = pygame.sprite.spritecollide(self, self.next_level_tiles, False)
         for tile in next_level_hits:
-            keys = pygame.key.get_pressed()
-            if keys[pygame.K_UP]:
+            if self.input_state[pygame.K_UP]:
                 # Trigger level progression logic
                 return True
         return False
@@ -278,27 +336,35 @@ class Player(pygame.sprite.Sprite):
 
     def update(self, dt):
         """Update player state"""
+        if self.owns_input:
+            self.input_state.sample()
+        self.time_ms += dt * 1000
+        
         # Check portal interaction
         self.near_portal = False
         portal_collisions = pygame.sprite.spritecollide(self, self.portal_sprites, False)
         if portal_collisions:
             self.near_portal = True
-            logging.info("Player near portal")
+            if tracer.debug:
+                tracer.record('near_portal', self.rect.topleft)
         
         # Check checkpoint collision
         checkpoint_hits = pygame.sprite.spritecollide(self, self.checkpoint_tiles, False)
         if checkpoint_hits:
             checkpoint = checkpoint_hits[0]
             self.checkpoint_pos = checkpoint.rect.topleft
-            logging.info(f"Checkpoint reached at position: {self.checkpoint_pos}")
+            if tracer.info:
+                tracer.record('checkpoint', self.checkpoint_pos)
         
         # Check next level collision
         if self.check_next_level_collision():
-            logging.info("Player reached next level")
+            if tracer.info:
+                tracer.record('next_level', self.rect.topleft)
         
         # Check finish collision
         if self.check_finish_collision():
-            logging.info("Player reached finish")
+            if tracer.info:
+                tracer.record('finish', self.rect.topleft)
         
         # Get input
         self.input()
@@ -310,8 +376,7 @@ class Player(pygame.sprite.Sprite):
         
         # Update invulnerability
         if self.invulnerable:
-            current_time = pygame.time.get_ticks()
-            if current_time - self.invulnerable_timer >= self.invulnerability_duration:
+            if self.time_ms - self.invulnerable_timer >= self.invulnerability_duration:
                 self.invulnerable = False
         
         # Update animation
@@ -0,0 +1,132 @@
+"""
+Per-subsystem frame timing.
+
+The main loop is split into named scopes with lap(name): each call charges
+the time since the previous lap to that name, so the scopes of a frame add
+up to the whole frame. end_frame() closes the frame and keeps each scope's
+total in a rolling window of PROFILE_WINDOW frames, from which p50/p95/p99
+are computed on demand for the overlay and the exit report. While disabled,
+lap() and end_frame() return after one attribute check.
+"""
+
+import csv
+import json
+import time
+from collections import deque
+import pygame
+from settings import *
+from ui import get_font
+
+FRAME_SCOPE = 'frame'  # Whole-frame time, kept next to the subsystem scopes
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+class FrameProfiler:
+    """Rolling per-scope frame timings, an on-screen overlay and CSV/JSON export"""
+    def __init__(self, enabled=PROFILE_ENABLED, window=PROFILE_WINDOW):
+        self.window = window
+        self.history = {}  # scope name -> deque of per-frame totals in ns
+        self.frame = {}  # scope name -> ns charged so far this frame
+        self.frames = 0
+        self.export_path = None
+        self.overlay_surface = None
+        self.set_enabled(enabled)
+
+    def set_enabled(self, enabled):
+        """Turn timing on or off, starting a fresh frame"""
+        self.enabled = enabled
+        self.frame.clear()
+        self.frame_start = self.last = time.perf_counter_ns()
+
+    def lap(self, name):
+        """Charge the time since the previous lap to a scope"""
+        if not self.enabled:
+            return
+        now = time.perf_counter_ns()
+        self.frame[name] = self.frame.get(name, 0) + now - self.last
+        self.last = now
+
+    def end_frame(self):
+        """Close the frame and add its scope totals to the rolling window"""
+        if not self.enabled:
+            return
+        now = time.perf_counter_ns()
+        self.frame[FRAME_SCOPE] = now - self.frame_start
+        for name in self.frame.keys() | self.history.keys():
+            samples = self.history.get(name)
+            if samples is None:
+                samples = self.history[name] = deque(maxlen=self.window)
+            samples.append(self.frame.get(name, 0))
+        self.frame.clear()
+        self.frame_start = self.last = now
+        self.frames += 1
+
+    def stats(self):
+        """Get {scope: {mean, p50, p95, p99, max}} in milliseconds over the window, slowest first"""
+        stats = {}
+        for name, samples in self.history.items():
+            values = sorted(samples)
+            stats[name] = {
+                'mean': sum(values) / len(values) / 1e6,
+                'p50': percentile(values, 0.50) / 1e6,
+                'p95': percentile(values, 0.95) / 1e6,
+                'p99': percentile(values, 0.99) / 1e6,
+                'max': values[-1] / 1e6,
+            }
+        return dict(sorted(stats.items(), key=lambda item: item[1]['mean'], reverse=True))
+
+    def clear(self):
+        """Drop all collected timings"""
+        self.history.clear()
+        self.frames = 0
+        self.overlay_surface = None
+        self.set_enabled(self.enabled)
+
+    def draw_overlay(self, surface, position=(WINDOW_WIDTH - 430, 10)):
+        """Draw the stats table, rebuilt every PROFILE_OVERLAY_REFRESH frames"""
+        if self.overlay_surface is None or self.frames % PROFILE_OVERLAY_REFRESH == 0:
+            self.overlay_surface = self.render_overlay()
+        surface.blit(self.overlay_surface, position)
+
+    def render_overlay(self):
+        """Render the stats table onto a translucent panel"""
+        font = get_font(20)
+        rows = [('scope', 'p50 ms', 'p95 ms', 'p99 ms')]
+        for name, values in self.stats().items():
+            rows.append((name, f"{values['p50']:.2f}", f"{values['p95']:.2f}", f"{values['p99']:.2f}"))
+        line_height = font.get_linesize()
+        panel = pygame.Surface((420, line_height * len(rows) + 10), pygame.SRCALPHA)
+        panel.fill((0, 0, 0, 170))
+        for index, row in enumerate(rows):
+            y = 5 + index * line_height
+            panel.blit(font.render(row[0], True, WHITE), (6, y))
+            # Numbers are right-aligned in fixed columns
+            for column, text in enumerate(row[1:]):
+                label = font.render(text, True, WHITE)
+                panel.blit(label, (230 + column * 85 - label.get_width(), y))
+        return panel
+
+    def export(self, path=None):
+        """Write the stats to path (or export_path), as JSON for .json files and CSV otherwise"""
+        path = path or self.export_path
+        if not path or not self.history:
+            return
+        stats = self.stats()
+        if path.endswith('.json'):
+            with open(path, 'w') as file:
+                json.dump({'frames': self.frames, 'window': self.window, 'scopes': stats}, file, indent=2)
+            return
+        with open(path, 'w', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(['scope', 'mean_ms', 'p50_ms', 'p95_ms', 'p99_ms', 'max_ms'])
+            for name, values in stats.items():
+                writer.writerow([name] + [f"{values[key]:.4f}" for key in ('mean', 'p50', 'p95', 'p99', 'max')])
+
+# Shared profiler used by the game loop
+profiler = FrameProfiler(PROFILE_ENABLED or bool(PROFILE_EXPORT_PATH))
+profiler.export_path = PROFILE_EXPORT_PATH
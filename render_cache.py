@@ -0,0 +1,88 @@
+import pygame
+from settings import *
+from tile_types import STATIC_TILE_TYPES
+
+class ChunkCache:
+    """
+    Pre-rendered surfaces for the static tiles of a level.
+    The level is split into square chunks of RENDER_CHUNK_SIZE tiles, each
+    baked once into its own surface. Drawing then costs one blit per visible
+    chunk instead of one per tile. Chunks are re-baked lazily after
+    invalidate() is called for an area that changed.
+    """
+    def __init__(self, chunk_tiles=RENDER_CHUNK_SIZE):
+        self.chunk_size = chunk_tiles * TILE_SIZE
+        self.chunks = {}  # (chunk_x, chunk_y) -> Surface, or None when empty
+        self.dirty = set()
+        self.tile_grid = None
+
+    def build(self, tile_grid):
+        """Bake every chunk that holds tiles from a TileGrid of static tiles"""
+        self.tile_grid = tile_grid
+        self.chunks.clear()
+        self.dirty.clear()
+        keys = {self.chunk_key(col * TILE_SIZE, row * TILE_SIZE) for col, row in tile_grid.cells}
+        for key in keys:
+            self.chunks[key] = self.render_chunk(key)
+
+    def chunk_key(self, x, y):
+        """Get the chunk coordinates holding a world position"""
+        return x // self.chunk_size, y // self.chunk_size
+
+    def chunk_rect(self, key):
+        """Get the world rect covered by a chunk"""
+        return pygame.Rect(key[0] * self.chunk_size, key[1] * self.chunk_size, self.chunk_size, self.chunk_size)
+
+    def render_chunk(self, key, tiles=None):
+        """Blit the static tiles of one chunk, or of the given tiles in it, onto a new surface"""
+        chunk_rect = self.chunk_rect(key)
+        if tiles is None:
+            tiles = self.tile_grid.query(chunk_rect, STATIC_TILE_TYPES)
+        else:
+            tiles = [tile for tile in tiles if tile.tile_type in STATIC_TILE_TYPES and tile.alive()]
+        if not tiles:
+            return None
+        surface = pygame.Surface(chunk_rect.size, pygame.SRCALPHA)
+        offset = (-chunk_rect.x, -chunk_rect.y)
+        surface.blits([(tile.image, tile.rect.move(offset)) for tile in tiles], doreturn=False)
+        # Chunks are mostly empty space and never drawn on again, so a
+        # run-length encoded display-format copy blits far faster
+        surface = surface.convert_alpha()
+        surface.set_alpha(255, pygame.RLEACCEL)
+        return surface
+
+    def add_chunk(self, key, tiles=None):
+        """Bake one chunk, e.g. when a streamed level chunk is loaded with the given tiles"""
+        self.chunks[key] = self.render_chunk(key, tiles)
+        self.dirty.discard(key)
+
+    def drop_chunk(self, key):
+        """Free the surface of a chunk that is no longer loaded"""
+        self.chunks.pop(key, None)
+        self.dirty.discard(key)
+
+    def invalidate(self, rect):
+        """Mark the chunks overlapping a world rect for re-baking"""
+        first_x, first_y = self.chunk_key(rect.left, rect.top)
+        last_x, last_y = self.chunk_key(rect.right - 1, rect.bottom - 1)
+        for chunk_y in range(first_y, last_y + 1):
+            for chunk_x in range(first_x, last_x + 1):
+                self.dirty.add((chunk_x, chunk_y))
+
+    def draw(self, surface, camera):
+        """Blit the chunks that intersect the camera view"""
+        if self.tile_grid is None:
+            return
+        view_rect = camera.view_rect
+        offset = camera.camera.topleft
+        first_x, first_y = self.chunk_key(view_rect.left, view_rect.top)
+        last_x, last_y = self.chunk_key(view_rect.right - 1, view_rect.bottom - 1)
+        for chunk_y in range(first_y, last_y + 1):
+            for chunk_x in range(first_x, last_x + 1):
+                key = (chunk_x, chunk_y)
+                if key in self.dirty:
+                    self.chunks[key] = self.render_chunk(key)
+                    self.dirty.discard(key)
+                chunk = self.chunks.get(key)
+                if chunk is not None:
+                    surface.blit(chunk, self.chunk_rect(key).move(offset))
@@ -3,6 +3,16 @@ WINDOW_WIDTH = 1280
 WINDOW_HEIGHT = 720
 FPS = 60
 TILE_SIZE = 16
+RENDER_CHUNK_SIZE = 32  # Width and height of a cached render chunk, in tiles
+
+# Frame pacing
+SIMULATION_RATE = FPS  # Fixed simulation steps per second
+MAX_STEPS_PER_FRAME = 5  # Steps a slow frame may catch up; older time is dropped
+RENDER_FPS = FPS  # Render cap while playing
+IDLE_FPS = 15  # Render cap on menus and end screens
+VSYNC = False  # Align presents to the display refresh (uses a scaled display)
+RENDER_INTERPOLATION = True  # Draw sprites and camera between the last two simulation steps
+INTERPOLATION_SNAP_DISTANCE = TILE_SIZE * 2  # Longer jumps in one step are not interpolated
 
 # Colors
 BLACK = (0, 0, 0)
@@ -16,15 +26,64 @@ PLAYER_SPEED = 5
 PLAYER_JUMP_SPEED = -8
 GRAVITY = 0.3
 
+# Enemy simulation level of detail, margins in pixels around the camera view
+ENEMY_ACTIVE_MARGIN = 256  # Enemies within this margin update every tick
+ENEMY_SLEEP_MARGIN = 1024  # Enemies beyond this margin are frozen
+ENEMY_LOD_INTERVAL = 4  # Ticks between updates for enemies in between
+ENEMY_BATCH_MIN_SIZE = 8  # Enemies of one type before they are simulated as a NumPy batch
+
+# Music settings
+MUSIC_FADE_MS = 500  # Crossfade time when switching tracks
+
+# UI settings
+UI_TEXT_CACHE_SIZE = 128  # Rendered text surfaces kept in the LRU cache
+
 # Menu settings
 BUTTON_WIDTH = 200
 BUTTON_HEIGHT = 50
 BUTTON_PADDING = 20
+DIRTY_RECT_UPDATES = True  # Menus and end screens only push the regions that changed
 
 # Asset paths
 TILE_SET_PATH = 'assets/tiles'
 PLAYER_SPRITES_PATH = 'assets/player'
 ENEMY_SPRITES_PATH = 'assets/enemies'  # Add enemy sprites path
 
+# Compiled levels are cached here, keyed by a hash of the level source
+LEVEL_CACHE_DIR = '.level_cache'
+
+# Background images of a preloaded level converted per frame
+PRELOAD_CONVERSIONS_PER_FRAME = 1
+
+# Level streaming settings
+STREAM_MIN_WIDTH = 2000  # Levels at least this many tiles wide are streamed
+STREAM_RADIUS = 2  # Chunks loaded beyond the camera view on each side, covering ENEMY_SLEEP_MARGIN
+STREAM_CHUNK_BUDGET = 48  # Loaded chunks kept before the least recently used are evicted
+
+# Texture atlas settings
+ATLAS_MANIFEST_PATH = 'assets/atlas/atlas.json'  # Built by texture_atlas.py
+ATLAS_PAGE_SIZE = 512  # Width and height of an atlas page in pixels
+ATLAS_SOURCES = ['assets/tiles/*.png', 'assets/player/*/*.png', 'assets/enemies/*.png']
+
 # Animation settings
 ANIMATION_SPEED = 0.15  # Lower number = faster animation
+
+# Event trace settings
+TRACE_LEVEL = 0  # 0 = off, 1 = info, 2 = debug
+TRACE_CAPACITY = 4096  # Events kept in the ring buffer
+TRACE_SAMPLE_RATE = 1  # Keep every Nth occurrence of each event
+TRACE_DUMP_PATH = None  # File the buffer is written to on exit, if set
+
+# Frame profiler (per-subsystem frame timings, F3 toggles the overlay)
+PROFILE_ENABLED = False  # Collect timings without the overlay shown
+PROFILE_WINDOW = 300  # Frames the rolling percentiles cover
+PROFILE_OVERLAY_REFRESH = 30  # Frames between overlay redraws
+PROFILE_EXPORT_PATH = None  # .csv or .json file the timings are written to on exit, if set
+
+# Frame spike capture (cProfile dumps of slow frames, off by default)
+SPIKE_CAPTURE = False
+SPIKE_BUDGET_MS = 50  # Frames slower than this are dumped
+SPIKE_HISTORY_FRAMES = 30  # Frames before a spike included in its dump
+SPIKE_DUMP_DIR = 'spikes'
+SPIKE_MAX_DUMPS = 20  # Stop dumping after this many spikes in a session
+SPIKE_REPORT_LINES = 40  # Functions listed in each spike's summary.txt
@@ -0,0 +1,109 @@
+"""
+Frame spike capture.
+
+While enabled, every frame of the main loop runs under its own cProfile
+profiler and the last SPIKE_HISTORY_FRAMES profiles are kept. The loop
+pauses the detector while it sleeps for the frame cap, so only work counts
+towards a frame's time. When a frame takes longer than SPIKE_BUDGET_MS, a
+directory is written under SPIKE_DUMP_DIR with:
+
+    frame.prof     cProfile stats of the slow frame
+    previous.prof  stats of the frames before it, merged
+    summary.txt    the slow frame's top functions by cumulative time
+    context.json   frame times, game state, level and player position
+
+The .prof files load with pstats or any cProfile viewer. cProfile slows
+Python code down noticeably, so capture is off unless asked for.
+"""
+
+import cProfile
+import json
+import os
+import pstats
+import time
+from collections import deque
+from settings import *
+
+class SpikeDetector:
+    """Profiles each frame and dumps the profiles around frames over budget"""
+    def __init__(self, enabled=SPIKE_CAPTURE, budget_ms=SPIKE_BUDGET_MS, history=SPIKE_HISTORY_FRAMES,
+                 output_dir=SPIKE_DUMP_DIR, max_dumps=SPIKE_MAX_DUMPS):
+        self.budget_ms = budget_ms
+        self.recent = deque(maxlen=history)  # (profile, frame ms) of the frames before the current one
+        self.output_dir = output_dir
+        self.max_dumps = max_dumps
+        self.dumps = 0
+        self.frames = 0
+        self.profile = None
+        self.frame_start = 0
+        self.pause_start = 0
+        self.enabled = enabled
+
+    def set_enabled(self, enabled):
+        """Turn capture on or off, dropping the profiles kept so far"""
+        if self.profile is not None:
+            self.profile.disable()
+            self.profile = None
+        self.recent.clear()
+        self.enabled = enabled
+
+    def begin_frame(self):
+        """Start profiling a frame"""
+        if not self.enabled:
+            return
+        self.profile = cProfile.Profile()
+        self.frame_start = time.perf_counter_ns()
+        self.profile.enable()
+
+    def pause(self):
+        """Stop timing and profiling the frame, e.g. while the loop waits out the frame cap"""
+        if self.profile is None:
+            return
+        self.profile.disable()
+        self.pause_start = time.perf_counter_ns()
+
+    def resume(self):
+        """Continue timing and profiling the frame, leaving out the time since pause()"""
+        if self.profile is None:
+            return
+        self.frame_start += time.perf_counter_ns() - self.pause_start
+        self.profile.enable()
+
+    def end_frame(self, context=None):
+        """
+        Stop profiling the frame and dump it if it went over budget.
+        context is called only for a spike and returns a dict describing
+        the game at that moment.
+        """
+        if self.profile is None:
+            return
+        self.profile.disable()
+        frame_ms = (time.perf_counter_ns() - self.frame_start) / 1e6
+        self.frames += 1
+        if frame_ms > self.budget_ms and self.dumps < self.max_dumps:
+            self.dump(frame_ms, context() if context else {})
+        self.recent.append((self.profile, frame_ms))
+        self.profile = None
+
+    def dump(self, frame_ms, context):
+        """Write the current frame's profile, the previous frames' profiles and context to a new directory"""
+        path = os.path.join(self.output_dir, f"spike_{self.dumps:03d}_frame_{self.frames:06d}")
+        os.makedirs(path, exist_ok=True)
+        self.profile.dump_stats(os.path.join(path, 'frame.prof'))
+        if self.recent:
+            previous = pstats.Stats(self.recent[0][0])
+            for profile, _ in list(self.recent)[1:]:
+                previous.add(profile)
+            previous.dump_stats(os.path.join(path, 'previous.prof'))
+        with open(os.path.join(path, 'summary.txt'), 'w') as file:
+            file.write(f"Frame {self.frames}: {frame_ms:.1f} ms (budget {self.budget_ms} ms)\n\n")
+            pstats.Stats(self.profile, stream=file).sort_stats('cumulative').print_stats(SPIKE_REPORT_LINES)
+        context = dict(context, frame=self.frames, frame_ms=frame_ms, budget_ms=self.budget_ms,
+                       previous_frame_ms=[frame_time for _, frame_time in self.recent])
+        with open(os.path.join(path, 'context.json'), 'w') as file:
+            json.dump(context, file, indent=2, default=str)
+        self.dumps += 1
+        print(f"Frame spike: {frame_ms:.1f} ms, profile written to {path}")
+
+# Shared detector used by the game loop
+spike_detector = SpikeDetector()
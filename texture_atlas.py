@@ -0,0 +1,155 @@
+"""
+Texture atlas for the tile, player and enemy images.
+
+Packs many small images into a few large page surfaces and records where
+each one went in a JSON manifest. The asset cache hands out subsurfaces of
+the pages, so the game keeps using the original image paths while all of
+them share a handful of surfaces.
+
+The manifest records a hash of every source image. The game builds the
+atlas on first run and rebuilds it whenever the sources no longer match,
+so edited images never keep serving old pixels. It can also be built
+ahead of time with:
+    python texture_atlas.py
+"""
+
+import os
+import json
+import glob
+import hashlib
+import pygame
+from settings import *
+
+ATLAS_FORMAT_VERSION = 2
+
+def atlas_key(path):
+    """Normalized image path used to look up atlas regions"""
+    return os.path.normpath(path).replace(os.sep, '/')
+
+def source_images(patterns=ATLAS_SOURCES):
+    """Get the sorted image paths matched by the glob patterns"""
+    paths = set()
+    for pattern in patterns:
+        paths.update(glob.glob(pattern))
+    return sorted(paths)
+
+def source_hashes(paths):
+    """Get {atlas key: sha1 of the file} for image paths"""
+    hashes = {}
+    for path in paths:
+        with open(path, 'rb') as file:
+            hashes[atlas_key(path)] = hashlib.sha1(file.read()).hexdigest()
+    return hashes
+
+class TextureAtlas:
+    """
+    Pages of packed images and the region of each image on its page.
+    Images are packed on shelves: sorted tallest first and placed left to
+    right in rows, starting a new row or page when one fills up.
+    """
+    def __init__(self, page_size=ATLAS_PAGE_SIZE):
+        self.page_size = page_size
+        self.pages = []
+        self.regions = {}  # key -> (page index, Rect)
+        self.subsurfaces = {}
+        self.sources = {}  # key -> sha1 of the packed source file
+
+    def pack(self, images):
+        """Pack a dict of key -> Surface into new pages"""
+        order = sorted(images, key=lambda key: (-images[key].get_height(), key))
+        page = None
+        x = y = shelf_height = 0
+        for key in order:
+            image = images[key]
+            width, height = image.get_size()
+            if width > self.page_size or height > self.page_size:
+                raise ValueError(f"{key} ({width}x{height}) does not fit on a {self.page_size} atlas page")
+            if page is not None and x + width > self.page_size:
+                # Start the next shelf
+                x, y, shelf_height = 0, y + shelf_height, 0
+            if page is None or y + height > self.page_size:
+                page = pygame.Surface((self.page_size, self.page_size), pygame.SRCALPHA)
+                self.pages.append(page)
+                x = y = shelf_height = 0
+            page.blit(image, (x, y))
+            self.regions[key] = (len(self.pages) - 1, pygame.Rect(x, y, width, height))
+            x += width
+            shelf_height = max(shelf_height, height)
+        self.subsurfaces.clear()
+
+    def pack_files(self, paths):
+        """Load image files and pack them, keyed by their normalized paths"""
+        self.pack({atlas_key(path): pygame.image.load(path) for path in paths})
+        self.sources.update(source_hashes(paths))
+
+    def is_current(self, paths):
+        """Check whether the atlas was packed from exactly these files, unchanged"""
+        return self.sources == source_hashes(paths)
+
+    def __contains__(self, path):
+        return atlas_key(path) in self.regions
+
+    def get(self, path):
+        """Get the shared subsurface holding an image, or None if it was not packed"""
+        key = atlas_key(path)
+        image = self.subsurfaces.get(key)
+        if image is None:
+            region = self.regions.get(key)
+            if region is None:
+                return None
+            page_index, rect = region
+            image = self.pages[page_index].subsurface(rect)
+            self.subsurfaces[key] = image
+        return image
+
+    def convert(self):
+        """Convert the pages to the display format for fast blitting"""
+        self.pages = [page.convert_alpha() for page in self.pages]
+        self.subsurfaces.clear()
+
+    def save(self, manifest_path):
+        """Write the pages as PNG files next to a JSON manifest"""
+        directory = os.path.dirname(manifest_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        base = os.path.splitext(os.path.basename(manifest_path))[0]
+        page_files = []
+        for index, page in enumerate(self.pages):
+            page_file = f"{base}_{index}.png"
+            pygame.image.save(page, os.path.join(directory, page_file))
+            page_files.append(page_file)
+        manifest = {
+            'version': ATLAS_FORMAT_VERSION,
+            'page_size': self.page_size,
+            'pages': page_files,
+            'sources': self.sources,
+            'regions': {key: [page_index, *rect] for key, (page_index, rect) in sorted(self.regions.items())},
+        }
+        with open(manifest_path, 'w') as file:
+            json.dump(manifest, file, indent=1)
+
+    @classmethod
+    def load(cls, manifest_path):
+        """Load an atlas saved with save()"""
+        with open(manifest_path) as file:
+            manifest = json.load(file)
+        if manifest.get('version') != ATLAS_FORMAT_VERSION:
+            raise ValueError(f"{manifest_path} is not a version {ATLAS_FORMAT_VERSION} atlas manifest")
+        atlas = cls(manifest['page_size'])
+        directory = os.path.dirname(manifest_path)
+        atlas.pages = [pygame.image.load(os.path.join(directory, page_file)) for page_file in manifest['pages']]
+        atlas.sources = manifest['sources']
+        for key, (page_index, x, y, width, height) in manifest['regions'].items():
+            atlas.regions[key] = (page_index, pygame.Rect(x, y, width, height))
+        return atlas
+
+def build_atlas(manifest_path=ATLAS_MANIFEST_PATH, patterns=ATLAS_SOURCES):
+    """Pack the source images and save the atlas, returning it"""
+    atlas = TextureAtlas()
+    atlas.pack_files(source_images(patterns))
+    atlas.save(manifest_path)
+    return atlas
+
+if __name__ == '__main__':
+    atlas = build_atlas()
+    print(f"Packed {len(atlas.regions)} images into {len(atlas.pages)} page(s): {ATLAS_MANIFEST_PATH}")
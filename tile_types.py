@@ -160,3 +160,12 @@ TILE_PROPERTIES = {
         'animation_frames': [],
     },
 }
+
+# Tile types whose appearance never changes, so they can be pre-rendered
+# into cached chunks instead of being blitted one by one every frame
+STATIC_TILE_TYPES = {
+    tile_type for tile_type, properties in TILE_PROPERTIES.items()
+    if tile_type != TileType.EMPTY
+    and not properties.get('animation_frames')
+    and 'pickup_type' not in properties
+}
@@ -1,8 +1,12 @@
 import pygame
 from settings import *
-from tile_types import TileType, TILE_PROPERTIES
-from level_data import parse_level_data
+from tile_types import TileType, TILE_PROPERTIES, STATIC_TILE_TYPES
+from level_compiler import load_compiled_level
+from level_streaming import LevelStreamer, should_stream
 from player import Player
+from collision_layer import CollisionLayer
+from asset_cache import load_image, load_tile_image, load_tile_frames, empty_tile_image
+from render_cache import ChunkCache
 import random
 
 class Tile(pygame.sprite.Sprite):
@@ -11,52 +15,45 @@ class Tile(pygame.sprite.Sprite):
         self.tile_type = tile_type
         self.properties = TILE_PROPERTIES[tile_type].copy()
         
-        # Load the image
+        # Load the image (shared between all tiles of this type)
         if self.properties['image']:
-            self.image = pygame.image.load(f"{TILE_SET_PATH}/{self.properties['image']}").convert_alpha()
+            self.image = load_tile_image(self.properties['image'])
         else:
-            # Create an empty surface for invisible tiles
-            self.image = pygame.Surface((TILE_SIZE, TILE_SIZE), pygame.SRCALPHA)
+            # Use an empty surface for invisible tiles
+            self.image = empty_tile_image()
         
         self.rect = self.image.get_rect(topleft=pos)
         # Create hitbox for any tile that needs collision detection
         self.hitbox = self.rect.inflate(0, -10) if self.properties.get('has_hitbox', False) else pygame.Rect(0, 0, 0, 0)
         
-        # Animation setup
+        # Animation setup, timed by the AnimationClock of the tile type
         self.animation_frames = []
         self.current_frame = 0
-        self.animation_time = 0
         if self.properties.get('animation_frames'):
             self.load_animation_frames()
     
     def load_animation_frames(self):
         """Load animation frames if specified in properties"""
-        for frame_file in self.properties['animation_frames']:
-            frame = pygame.image.load(f"{TILE_SET_PATH}/{frame_file}").convert_alpha()
-            self.animation_frames.append(frame)
+        self.animation_frames = load_tile_frames(self.properties['animation_frames'])
     
-    def update(self, dt):
-        """Update tile animation if it has one"""
-        if self.animation_frames:
-            self.animation_time += dt
-            if self.animation_time >= ANIMATION_SPEED:
-                self.animation_time = 0
-                self.current_frame = (self.current_frame + 1) % len(self.animation_frames)
-                self.image = self.animation_frames[self.current_frame]
+    def set_frame(self, frame):
+        """Show one of the tile's animation frames"""
+        self.current_frame = frame
+        self.image = self.animation_frames[frame]
 
 class Portal(Tile):
     def __init__(self, pos, tile_type, groups):
         super().__init__(pos, tile_type, groups)
-        self.last_used = 0  # Timestamp of last portal use
+        self.last_used = None  # Player time_ms of the last use, None if never used
         self.linked_portal = None  # Will be set by TileMap
         
-    def can_use(self):
-        current_time = pygame.time.get_ticks()
-        return current_time - self.last_used >= self.properties['cooldown']
+    def can_use(self, current_time):
+        return self.last_used is None or current_time - self.last_used >= self.properties['cooldown']
         
     def teleport(self, player):
-        if self.can_use() and self.linked_portal:
-            current_time = pygame.time.get_ticks()
+        # Timed on the player's simulated clock (see frame_scheduler)
+        current_time = player.time_ms
+        if self.can_use(current_time) and self.linked_portal:
             # Update cooldown for both portals
             self.last_used = current_time
             self.linked_portal.last_used = current_time
@@ -85,11 +82,149 @@ class Pickup(Tile):
                 player.lives += self.value
             self.kill()  # Remove the pickup from all sprite groups
 
+class TileGroup(pygame.sprite.Group):
+    """Sprite group that reports every tile removed from it, e.g. by kill()"""
+    def __init__(self, on_remove):
+        super().__init__()
+        self.on_remove = on_remove
+
+    def remove_internal(self, sprite):
+        super().remove_internal(sprite)
+        self.on_remove(sprite)
+
+class TileGrid:
+    """
+    Uniform grid of tile sprites keyed by (col, row) cell, for finding the
+    sprites to draw in an area. Collision never uses it: that goes through
+    the CollisionLayer, which stores tile types rather than sprites.
+    """
+    def __init__(self, cell_size=TILE_SIZE):
+        self.cell_size = cell_size
+        self.cells = {}
+
+    def clear(self):
+        """Remove every tile from the grid"""
+        self.cells.clear()
+
+    def cell_range(self, rect):
+        """Return the column and row ranges of the cells a rect overlaps"""
+        if rect.width < 0 or rect.height < 0:
+            # Inflated hitboxes can end up with negative sizes
+            rect = rect.copy()
+            rect.normalize()
+        size = self.cell_size
+        cols = range(rect.left // size, (rect.right - 1) // size + 1)
+        rows = range(rect.top // size, (rect.bottom - 1) // size + 1)
+        return cols, rows
+
+    def add(self, tile):
+        """Insert a tile into every cell its rect overlaps"""
+        cols, rows = self.cell_range(tile.rect)
+        for row in rows:
+            for col in cols:
+                self.cells.setdefault((col, row), []).append(tile)
+
+    def remove(self, tile):
+        """Remove a tile from every cell its rect overlaps"""
+        cols, rows = self.cell_range(tile.rect)
+        for row in rows:
+            for col in cols:
+                cell = self.cells.get((col, row))
+                if cell and tile in cell:
+                    cell.remove(tile)
+                    if not cell:
+                        del self.cells[(col, row)]
+
+    def query(self, rect, tile_types=None):
+        """
+        Return the tiles whose cells overlap rect, optionally limited to the
+        given tile types. Callers still do the precise hitbox test.
+        """
+        found = []
+        seen = set()
+        cols, rows = self.cell_range(rect)
+        for row in rows:
+            for col in cols:
+                for tile in self.cells.get((col, row), ()):
+                    if tile_types is not None and tile.tile_type not in tile_types:
+                        continue
+                    if id(tile) in seen or not tile.alive():
+                        continue
+                    seen.add(id(tile))
+                    found.append(tile)
+        return found
+
+class AnimationClock:
+    """Frame timer shared by every tile of one animated tile type"""
+    def __init__(self, frame_count):
+        self.frame_count = frame_count
+        self.frame = 0
+        self.time = 0
+
+    def advance(self, dt):
+        """Advance by dt seconds, returning True when the frame changed"""
+        self.time += dt
+        if self.time >= ANIMATION_SPEED:
+            self.time = 0
+            self.frame = (self.frame + 1) % self.frame_count
+            return True
+        return False
+
+class AnimatedTiles:
+    """
+    Registry of the tiles that have animation frames.
+    Each animated tile type has a single AnimationClock, and frames are only
+    swapped on animated tiles in view, so static tiles and off-screen
+    animations cost nothing per frame. Tiles that scroll into view pick up
+    their type's current frame.
+    """
+    def __init__(self):
+        self.clocks = {}
+        # Coarse cells keep a camera-sized query to a few dozen lookups
+        self.grid = TileGrid(cell_size=TILE_SIZE * 8)
+        self.tiles = set()
+        self.last_view = None
+
+    def clear(self):
+        """Forget every registered tile and restart the clocks"""
+        self.clocks.clear()
+        self.grid.clear()
+        self.tiles.clear()
+        self.last_view = None
+
+    def add(self, tile):
+        """Register a tile with animation frames"""
+        if tile.tile_type not in self.clocks:
+            self.clocks[tile.tile_type] = AnimationClock(len(tile.animation_frames))
+        self.grid.add(tile)
+        self.tiles.add(tile)
+
+    def remove(self, tile):
+        """Unregister a tile, e.g. when its level chunk is evicted"""
+        self.grid.remove(tile)
+        self.tiles.discard(tile)
+
+    def update(self, dt, view_rect=None):
+        """Advance each type's clock once and sync the tiles in view_rect (all tiles if None)"""
+        changed = False
+        for clock in self.clocks.values():
+            if clock.advance(dt):
+                changed = True
+        if not changed and view_rect is not None and view_rect == self.last_view:
+            return
+        self.last_view = view_rect
+        tiles = self.tiles if view_rect is None else self.grid.query(view_rect)
+        clocks = self.clocks
+        for tile in tiles:
+            frame = clocks[tile.tile_type].frame
+            if tile.current_frame != frame:
+                tile.set_frame(frame)
+
 class TileMap:
     def __init__(self, game):
         self.game = game
         self.display_surface = pygame.display.get_surface()
-        self.all_sprites = pygame.sprite.Group()
+        self.all_sprites = TileGroup(self.on_tile_removed)
         self.solid_tiles = pygame.sprite.Group()
         self.platform_tiles = pygame.sprite.Group()
         self.ladder_tiles = pygame.sprite.Group()
@@ -103,6 +238,15 @@ class TileMap:
         self.next_level_tiles = pygame.sprite.Group()
         self.finish_tiles = pygame.sprite.Group()
         self.portals = {'1': [], '2': []}
+        # Sprite indexes for drawing. Each tile is in exactly one of them.
+        self.static_grid = TileGrid()  # Static tiles, baked into the render cache
+        # Animated and interactive tiles drawn every frame. They are few and
+        # queried with the whole view, so coarse cells keep that to a few dozen lookups.
+        self.dynamic_grid = TileGrid(cell_size=TILE_SIZE * 8)
+        self.animated_tiles = AnimatedTiles()
+        self.streamer = None  # LevelStreamer while a large level is streamed in
+        self.render_cache = ChunkCache()
+        self.collision_layer = CollisionLayer()
         
         self.tile_list = {}
         self.entity_list = {}
@@ -140,14 +284,14 @@ class TileMap:
         return groups
 
     def load_tileset(self, path):
-        """Load tileset images from a directory"""
+        """Load tileset images from a directory, warming the shared image cache"""
         import os
         for tile_type in TileType:
             properties = TILE_PROPERTIES[tile_type]
             if properties.get('image'):
                 image_path = os.path.join(path, properties['image'])
                 if os.path.exists(image_path):
-                    self.tile_list[tile_type] = pygame.image.load(image_path).convert_alpha()
+                    self.tile_list[tile_type] = load_image(image_path)
 
     def create_tile(self, tile_type, pos):
         """Create a tile of the specified type at the given position"""
@@ -161,14 +305,55 @@ class TileMap:
             if len(self.portals[portal_type]) == 2:
                 self.portals[portal_type][0].linked_portal = self.portals[portal_type][1]
                 self.portals[portal_type][1].linked_portal = self.portals[portal_type][0]
+            self.add_to_grids(portal)
             return portal
         elif tile_type in [TileType.PICKUP_COIN, TileType.PICKUP_ONEUP]:
-            return Pickup(pos, tile_type, groups)
+            tile = Pickup(pos, tile_type, groups)
+        else:
+            tile = Tile(pos, tile_type, groups)
+        self.add_to_grids(tile)
+        return tile
+
+    def add_to_grids(self, tile):
+        """Index a new tile for rendering"""
+        if tile.tile_type in STATIC_TILE_TYPES:
+            self.static_grid.add(tile)
+        else:
+            self.dynamic_grid.add(tile)
+        if tile.animation_frames:
+            self.animated_tiles.add(tile)
+
+    def remove_from_grids(self, tile):
+        """Drop a tile from the rendering grids"""
+        if tile.tile_type in STATIC_TILE_TYPES:
+            self.static_grid.remove(tile)
         else:
-            return Tile(pos, tile_type, groups)
+            self.dynamic_grid.remove(tile)
+        if tile.animation_frames:
+            self.animated_tiles.remove(tile)
 
-    def load_map(self, level_data):
-        """Create a level from the level data dictionary"""
+    def on_tile_removed(self, tile):
+        """Re-bake the cached chunk under a tile that was removed from the map"""
+        if self.streamer is not None:
+            if self.streamer.evicting:
+                return
+            self.streamer.forget(tile)
+        if tile.tile_type in STATIC_TILE_TYPES:
+            self.render_cache.invalidate(tile.rect)
+
+    def close(self):
+        """Release the memory-mapped level of a streamed level, if one is loaded"""
+        if self.streamer is not None:
+            self.streamer.close()
+            self.streamer = None
+
+    def load_map(self, level_data, compiled=None):
+        """
+        Create a level from the level data dictionary, using its already
+        compiled form if one is given (see level_preloader)
+        """
+        self.close()
+        
         # Clear existing tiles and entities
         self.all_sprites.empty()
         self.solid_tiles.empty()
@@ -184,25 +369,33 @@ class TileMap:
         self.next_level_tiles.empty()
         self.finish_tiles.empty()
         self.entity_list.clear()  # Clear the dictionary
+        self.static_grid.clear()
+        self.dynamic_grid.clear()
+        self.animated_tiles.clear()
         
-        # Parse level data
-        main_layer, entities, background = parse_level_data(level_data)
+        # Read the compiled level grids straight from the memory-mapped file
+        level = compiled or load_compiled_level(level_data)
+        self.collision_layer.load_grids(level.background, level.main)
         
-        # Create background tiles
-        for row_index, row in enumerate(background):
-            for col_index, tile_type in enumerate(row):
-                if tile_type != TileType.EMPTY:
-                    x = col_index * TILE_SIZE
-                    y = row_index * TILE_SIZE
-                    self.create_tile(tile_type, (x, y))
+        if should_stream(level, level_data):
+            # Tiles are created chunk by chunk around the camera, starting at the player spawn
+            self.render_cache.build(self.static_grid)
+            self.spawn_entities(level.entities)
+            self.streamer = LevelStreamer(self, level, self.game.spawn_enemy)
+            spawn_view = pygame.Rect(0, 0, WINDOW_WIDTH, WINDOW_HEIGHT)
+            spawn_view.center = self.get_player_spawn()
+            self.streamer.update(spawn_view)
+            return
         
-        # Create main layer tiles
-        for row_index, row in enumerate(main_layer):
-            for col_index, tile_type in enumerate(row):
-                if tile_type != TileType.EMPTY:
-                    x = col_index * TILE_SIZE
-                    y = row_index * TILE_SIZE
-                    self.create_tile(tile_type, (x, y))
+        with level:
+            # Create background tiles, then main layer tiles
+            for grid in (level.background, level.main):
+                for col, row, tile_type in grid.tiles():
+                    self.create_tile(tile_type, (col * TILE_SIZE, row * TILE_SIZE))
+            entities = level.entities
+        
+        # Pre-render the static tiles
+        self.render_cache.build(self.static_grid)
         
         # Create entities
         self.spawn_entities(entities)
@@ -235,10 +428,13 @@ class TileMap:
         # Default spawn if none specified
         return (TILE_SIZE * 2, TILE_SIZE * 2)
 
+    def get_tiles_in_rect(self, rect, tile_types=None):
+        """Get the tiles of the given types whose grid cells overlap rect"""
+        return self.static_grid.query(rect, tile_types) + self.dynamic_grid.query(rect, tile_types)
+
     def check_portal_interaction(self, player):
         # Check if player is pressing up key
-        keys = pygame.key.get_pressed()
-        if not keys[pygame.K_UP]:
+        if not player.input_state[pygame.K_UP]:
             return
             
         # Check collision with any portal
@@ -254,8 +450,21 @@ class TileMap:
             if player.hitbox.colliderect(pickup.hitbox):
                 pickup.collect(player)
 
-    def update(self, dt):
-        """Update all tiles (for animations, etc.)"""
-        for sprite in self.all_sprites:
-            if hasattr(sprite, 'update'):
-                sprite.update(dt)
+    def draw(self, surface, camera):
+        """
+        Draw the cached static chunks in view, then the animated and
+        dynamic tiles in grid cells that intersect the camera view on top
+        """
+        self.render_cache.draw(surface, camera)
+        offset = camera.camera.topleft
+        tiles = self.dynamic_grid.query(camera.view_rect)
+        surface.blits([(tile.image, tile.rect.move(offset)) for tile in tiles], doreturn=False)
+
+    def update(self, dt, view_rect=None):
+        """
+        Stream level chunks around view_rect and advance tile animations,
+        swapping frames only for tiles in view_rect when given
+        """
+        if self.streamer is not None and view_rect is not None:
+            self.streamer.update(view_rect)
+        self.animated_tiles.update(dt, view_rect)
@@ -0,0 +1,83 @@
+"""
+Shared fonts, cached text surfaces and HUD widgets.
+
+Rendering text is one of the more expensive things a frame does, so UI
+code goes through this module instead of calling Font.render directly:
+fonts are created once per (name, size), rendered strings are kept in an
+LRU cache keyed by (font, text, color), and HudText widgets only render
+again when the value they show changes.
+"""
+
+from collections import OrderedDict
+import pygame
+from settings import *
+
+_fonts = {}
+_overlays = {}
+
+def get_font(size, name=None):
+    """Get the shared Font for a font file (None for the default font) and size"""
+    key = (name, size)
+    font = _fonts.get(key)
+    if font is None:
+        font = pygame.font.Font(name, size)
+        _fonts[key] = font
+    return font
+
+def get_overlay(color, size=(WINDOW_WIDTH, WINDOW_HEIGHT)):
+    """Get a shared surface filled with an RGBA color, e.g. to dim the screen"""
+    key = (tuple(color), tuple(size))
+    overlay = _overlays.get(key)
+    if overlay is None:
+        overlay = pygame.Surface(size, pygame.SRCALPHA)
+        overlay.fill(color)
+        _overlays[key] = overlay
+    return overlay
+
+class TextCache:
+    """Rendered text surfaces, evicting the least recently used past capacity"""
+    def __init__(self, capacity=UI_TEXT_CACHE_SIZE):
+        self.capacity = capacity
+        self.surfaces = OrderedDict()
+
+    def render(self, text, size=36, color=WHITE, font_name=None):
+        """Get the shared surface for a string, rendering it only on a cache miss"""
+        key = (font_name, size, text, tuple(color))
+        surface = self.surfaces.get(key)
+        if surface is None:
+            surface = get_font(size, font_name).render(text, True, color)
+            self.surfaces[key] = surface
+            if len(self.surfaces) > self.capacity:
+                self.surfaces.popitem(last=False)
+        else:
+            self.surfaces.move_to_end(key)
+        return surface
+
+    def clear(self):
+        """Drop every cached surface"""
+        self.surfaces.clear()
+
+# Shared cache used by the game's UI
+text_cache = TextCache()
+
+def render_text(text, size=36, color=WHITE, font_name=None):
+    """Render text through the shared cache"""
+    return text_cache.render(text, size, color, font_name)
+
+class HudText:
+    """A line of HUD text bound to a value, rendered again only when the value changes"""
+    def __init__(self, position, template, size=36, color=WHITE, font_name=None):
+        self.position = position
+        self.template = template  # Format string with one {} for the value
+        self.size = size
+        self.color = color
+        self.font_name = font_name
+        self.value = None
+        self.surface = None
+
+    def draw(self, surface, value):
+        """Blit the widget, re-rendering first if value changed"""
+        if self.surface is None or value != self.value:
+            self.value = value
+            self.surface = get_font(self.size, self.font_name).render(self.template.format(value), True, self.color)
+        surface.blit(self.surface, self.position)